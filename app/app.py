@@ -1,14 +1,59 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi import Query, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile as FormFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from email.utils import formatdate, parsedate_to_datetime
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
 from pathlib import Path
 
-from app.redaction import redact_text
+from app import config
+from app import metrics
+from app.cache import ResultCache
+from app.executor import ExecutorBusy, preview_executor, redaction_executor
+from app.hashing import sha256_file
+from app.jobs import DONE, QUEUED, JobRunner, JobStore, ProgressReporter
+from app.matching import normalize_keyword
+from app.patterns import normalize_patterns
+from app.policies import PolicyStore, compile_policy
+from app.previews import FORMATS, PreviewCache, document_info, render_page
+from app.redaction import (
+    DEFAULT_FILL, DEFAULT_PLACEHOLDER, ENGINE_VERSION, find_matches, redact_bytes, redact_text, render_diff,
+)
+from app.storage import ObjectStore, is_object_key, link, make_backend, prune_links
+from app.textindex import TextIndex, build_index, index_path
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_runner.start()
+    gc_task = asyncio.create_task(collect_garbage())
+    yield
+    gc_task.cancel()
+    await job_runner.stop()
+    # Wait for in-flight redactions and stop the worker processes
+    redaction_executor.shutdown()
+    preview_executor.shutdown()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+logger = logging.getLogger(__name__)
 
 # Enable CORS for frontend integration
 app.add_middleware(
@@ -24,13 +69,169 @@ OUTPUT_DIR = Path("outputs")
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Before/after renders of diff previews, one directory per stored output
+DIFF_DIR = OUTPUT_DIR / "diffs"
+DIFF_DIR.mkdir(parents=True, exist_ok=True)
+
+# Uploads and outputs are stored once per content hash; names in the
+# directories above are links to the stored objects
+upload_store = ObjectStore(
+    make_backend(config.STORAGE_BACKEND, os.path.join(config.STORAGE_DIR, "uploads")),
+    config.UPLOAD_TTL, config.UPLOAD_STORE_MAX_BYTES,
+)
+output_store = ObjectStore(
+    make_backend(config.STORAGE_BACKEND, os.path.join(config.STORAGE_DIR, "outputs")),
+    config.OUTPUT_TTL, config.OUTPUT_STORE_MAX_BYTES,
+    # The diff renders of an output go with it
+    on_delete=lambda key: shutil.rmtree(DIFF_DIR / key, ignore_errors=True),
+)
+
+# Cache of finished redactions, keyed on input content and request parameters
+result_cache = ResultCache(config.RESULT_CACHE_DIR, config.RESULT_CACHE_MAX_BYTES)
+
+# Gauges and counters read from live objects when /metrics is scraped
+metrics.registry.gauge("redaction_queue_depth", "Redactions running or waiting for a worker.",
+                       callback=lambda: redaction_executor.pending)
+metrics.registry.counter("result_cache_hits_total", "Redactions served from the result cache.",
+                         callback=lambda: result_cache.hits)
+metrics.registry.counter("result_cache_misses_total", "Redactions not found in the result cache.",
+                         callback=lambda: result_cache.misses)
+metrics.registry.counter("storage_objects_collected_total", "Stored uploads and outputs deleted by garbage collection.",
+                         callback=lambda: upload_store.collected + output_store.collected)
+
+# Rendered page previews, and page counts/sizes per file hash
+preview_cache = PreviewCache(config.PREVIEW_CACHE_DIR, config.PREVIEW_MEMORY_BYTES,
+                             config.PREVIEW_CACHE_MAX_BYTES)
+metrics.registry.counter("preview_cache_evictions_total", "Rendered previews deleted from disk to stay within the quota.",
+                         callback=lambda: preview_cache.evictions)
+document_infos = {}
+preview_renders = {}  # cache key -> in-flight render task
+background_tasks = set()  # fire-and-forget tasks, referenced until done
+
+# Page text indexes being built, per file hash
+index_builds = {}
+
+# Persistent job queue for /jobs; runners are started with the app
+job_store = JobStore(config.JOBS_DB)
+
+# Saved policies, and their validated form per (name, version)
+policy_store = PolicyStore(config.POLICIES_DB)
+compiled_policies = {}
+
+# Redaction queue is full: tell the client to back off and retry
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request: Request, exc: ExecutorBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# Count and time every request, labelled by route template rather than raw path
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.http_requests.inc(method=request.method, route=path, status=status)
+        metrics.http_latency.observe(time.perf_counter() - start, method=request.method, route=path)
+
+# Reject oversized uploads from their Content-Length before the body is read
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.url.path in ("/upload", "/redact/stream"):
+        length = request.headers.get("content-length")
+        # Allow a little slack for the multipart envelope around the file
+        if length and length.isdigit() and int(length) > config.UPLOAD_MAX_BYTES + 64 * 1024:
+            return JSONResponse(status_code=413, content={"detail": "File too large."})
+    return await call_next(request)
+
 # Pydantic model for manual redaction input
 class RedactionRequest(BaseModel):
     filename: str
     keywords: Optional[str] = ""
     page_range: Optional[str] = ""
     remove_graphics: Optional[bool] = False
+    # Which images remove_graphics affects: "all" (removed from the document,
+    # so also from pages outside page_range that share them), "overlap" (only
+    # those under a redaction) or "pixelate" (overlapping ones are pixelated),
+    # and the smallest size in points that counts
+    image_mode: Optional[str] = "all"
+    image_min_size: Optional[float] = 0
+    # MD5 digests (hex) of images to always remove, e.g. a logo
+    image_hashes: Optional[list[str]] = None
     manual_boxes: Optional[list[dict]] = None
+    # Built-in pattern names (ssn, email, phone, iban, credit_card) or regexes
+    patterns: Optional[list[str]] = None
+    # Save strategy: "fast", "balanced" or "compact"
+    save_mode: Optional[str] = "balanced"
+    linearize: Optional[bool] = False
+    # Keep low-res before/after renders of the modified pages
+    preview_diff: Optional[bool] = False
+    # Check the output for text the policy should have removed (text layer of the
+    # modified pages, annotations, metadata) and report pass/fail per page
+    verify: Optional[bool] = False
+    # OCR scanned pages (no text layer) so keywords and patterns find text there too
+    ocr: Optional[bool] = False
+    ocr_dpi: Optional[int] = None
+    ocr_language: Optional[str] = "eng"
+    # Label and fill color ("#rrggbb") of redacted areas
+    placeholder: Optional[str] = None
+    fill: Optional[str] = None
+    # Use a policy saved with POST /policies instead of the fields above
+    # (latest version unless policy_version is given)
+    policy_id: Optional[str] = None
+    policy_version: Optional[int] = None
+
+# Pydantic model for batch redaction: one policy applied to many uploaded files
+class BatchRedactionRequest(BaseModel):
+    filenames: list[str]
+    keywords: Optional[str] = ""
+    page_range: Optional[str] = ""
+    remove_graphics: Optional[bool] = False
+    image_mode: Optional[str] = "all"
+    image_min_size: Optional[float] = 0
+    image_hashes: Optional[list[str]] = None
+    # Manual boxes per file name
+    manual_boxes: Optional[dict[str, list[dict]]] = None
+    patterns: Optional[list[str]] = None
+    save_mode: Optional[str] = "balanced"
+    linearize: Optional[bool] = False
+    preview_diff: Optional[bool] = False
+    ocr: Optional[bool] = False
+    ocr_dpi: Optional[int] = None
+    ocr_language: Optional[str] = "eng"
+    placeholder: Optional[str] = None
+    fill: Optional[str] = None
+    policy_id: Optional[str] = None
+    policy_version: Optional[int] = None
+
+# Pydantic model for a saved policy: the rules of a redaction request under a name
+class PolicyRequest(BaseModel):
+    name: str
+    keywords: Optional[str] = ""
+    page_range: Optional[str] = ""
+    remove_graphics: Optional[bool] = False
+    image_mode: Optional[str] = "all"
+    image_min_size: Optional[float] = 0
+    image_hashes: Optional[list[str]] = None
+    patterns: Optional[list[str]] = None
+    save_mode: Optional[str] = "balanced"
+    linearize: Optional[bool] = False
+    ocr: Optional[bool] = False
+    ocr_dpi: Optional[int] = None
+    ocr_language: Optional[str] = "eng"
+    placeholder: Optional[str] = None
+    fill: Optional[str] = None
+
+# Request fields a saved policy takes the place of
+POLICY_FIELDS = set(PolicyRequest.model_fields) - {"name"}
 
 # Utility to sanitize file names
 def sanitize_filename(filename: str) -> str:
@@ -39,39 +240,66 @@ def sanitize_filename(filename: str) -> str:
 
 # --- Endpoint: Upload PDF File ---
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), index: bool = False):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=415, detail="Only PDF files are allowed.")
 
     filename = sanitize_filename(file.filename)
     upload_path = UPLOAD_DIR / filename
 
+    if file.size is not None and file.size > config.UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File too large.")
+
+    # Store by content hash, then point the name at it: concurrent uploads under
+    # one name can't mix, and their file_id keeps referring to their own content
+    staging = Path(await run_in_threadpool(upload_store.staging_path, ".pdf"))
     try:
-        contents = await file.read()
-        with open(upload_path, "wb") as f:
-            f.write(contents)
+        size, sha256 = await save_upload(file, staging)
+        await run_in_threadpool(publish, upload_store, staging, upload_path, sha256, {"filename": filename})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    finally:
+        if staging.exists():
+            os.remove(staging)
 
-    return {"filename": filename, "message": "File uploaded successfully."}
+    # Optionally build the page text index in the background for /search and /redact/
+    indexing = index or config.TEXT_INDEX_ON_UPLOAD
+    if indexing:
+        task = asyncio.create_task(ensure_index(upload_path, sha256))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+        task.add_done_callback(log_index_failure)
 
-# --- Endpoint: Redact file with manual inputs and keyword search ---
-@app.post("/redact/")
-async def redact_with_manual(request: RedactionRequest):
-    filename = sanitize_filename(request.filename)
-    input_path = UPLOAD_DIR / filename
-    output_path = OUTPUT_DIR / f"redacted_{filename}"
+    return {
+        "filename": filename,
+        "file_id": sha256,
+        "size": size,
+        "sha256": sha256,
+        "indexing": bool(indexing),
+        "message": "File uploaded successfully.",
+    }
 
-    # Check file existence
-    if not input_path.exists():
-        raise HTTPException(status_code=404, detail="File not found in uploads directory.")
+# --- Helper: Validate a redaction request into redact_text arguments ---
+async def prepare_redaction(request: RedactionRequest) -> dict:
+    """
+    Check the request and turn it into keyword arguments for redact_text
+    (everything except output_path). Raises HTTPException on bad input.
+    """
+    input_path = uploaded_path(request.filename)
+    return {"input_path": str(input_path), **await validate_policy(request)}
 
-    # Validate and parse keywords
-    keywords = []
-    if request.keywords:
-        if not isinstance(request.keywords, str):
-            raise HTTPException(status_code=422, detail="Keywords must be a comma-separated string.")
-        keywords = [k.strip() + ' ' for k in request.keywords.split(",") if k.strip()]
+# --- Helper: Validate the redaction policy of a request (everything but the file) ---
+async def validate_policy(request: RedactionRequest) -> dict:
+    if request.policy_id:
+        conflicting = sorted(POLICY_FIELDS & request.model_fields_set)
+        if conflicting:
+            raise HTTPException(status_code=422, detail=f"policy_id cannot be combined with: {', '.join(conflicting)}.")
+        # (may read the policy store, so not on the event loop)
+        rules = await run_in_threadpool(load_policy, request.policy_id, request.policy_version)
+    else:
+        rules = compile_rules(request)
 
     # Validate manual boxes
     if request.manual_boxes:
@@ -80,34 +308,527 @@ async def redact_with_manual(request: RedactionRequest):
             if not required_keys.issubset(box):
                 raise HTTPException(status_code=422, detail="Each manual box must include page, x0, y0, x1, y1.")
 
-    # Parse page range (e.g., "1-3,5")
+    return {
+        **rules,
+        "manual_boxes": request.manual_boxes,
+        "preview_diff": bool(request.preview_diff),
+        "verify": bool(request.verify),
+    }
+
+# --- Helper: Validate the rules shared by requests and saved policies ---
+def compile_rules(request) -> dict:
+    """
+    Check and parse the policy fields of a RedactionRequest or PolicyRequest
+    into redact_text arguments. Raises HTTPException on bad input.
+    """
     try:
-        pages = parse_page_range(request.page_range)
+        return compile_policy(request.model_dump(include=POLICY_FIELDS))
     except ValueError as e:
-        raise HTTPException(status_code=422, detail=f"Invalid page range: {str(e)}")
+        raise HTTPException(status_code=422, detail=str(e))
+
+# --- Helper: Validated rules of a saved policy, compiled once per version ---
+def load_policy(name: str, version: Optional[int] = None) -> dict:
+    """
+    Versions never change, so their compiled rules are kept for the life of
+    the process; only resolving "latest" costs a (primary key) lookup.
+    """
+    if version is None:
+        version = policy_store.latest_version(name)
+        if version is None:
+            raise HTTPException(status_code=404, detail=f"Policy '{name}' not found.")
+    rules = compiled_policies.get((name, version))
+    if rules is None:
+        policy = policy_store.get(name, version)
+        if policy is None:
+            raise HTTPException(status_code=404, detail=f"Policy '{name}' version {version} not found.")
+        rules = compiled_policies[(name, version)] = compile_rules(PolicyRequest(name=name, **policy["body"]))
+    return rules
+
+# --- Helper: Run a prepared redaction through the result cache and worker pool ---
+async def run_redaction(params: dict, output_path: Path, progress=None,
+                        diff_dir: Path = None) -> dict:
+    """
+    Redact `params` (from prepare_redaction) into output_path and return the
+    engine's report, with "cached" telling whether it came from the result
+    cache. With "preview_diff", before/after renders of the modified pages
+    are written to `diff_dir` (from new_diff_dir). ExecutorBusy propagates
+    to the caller.
+    """
+    params = dict(params)
+    diff_dir = str(diff_dir) if params.pop("preview_diff", False) and diff_dir else None
 
-    # Perform redaction
+    # Workers reuse text extracted from the same content; the hash also keys the result cache
+    input_hash = await run_in_threadpool(sha256_file, params["input_path"])
+
+    # Identical job seen before? Serve the stored output
+    cache_key = None
+    if result_cache.enabled:
+        cache_key = result_cache.make_key(
+            input_hash,
+            normalize_redaction_params(params),
+            ENGINE_VERSION,
+        )
+        report = await run_in_threadpool(result_cache.get, cache_key, str(output_path))
+        if report is not None:
+            if diff_dir:
+                # No redaction pass to piggyback on, so render from both files
+                await redaction_executor.run(
+                    render_diff, params["input_path"], str(output_path),
+                    report["pages_modified"], diff_dir, config.DIFF_PREVIEW_DPI,
+                )
+            return {**report, "cached": True}
+
+    # Perform redaction in a worker process so the event loop stays free
     try:
-        redact_text(
-            input_path=str(input_path),
+        candidate_pages = await run_in_threadpool(index_candidates, params, input_hash)
+        report = await redaction_executor.run(
+            redact_text,
             output_path=str(output_path),
-            keywords=keywords,
-            pages=pages,
-            remove_images=request.remove_graphics,
-            manual_boxes=request.manual_boxes
+            page_workers=config.REDACTION_PAGE_WORKERS,
+            min_parallel_pages=config.REDACTION_PARALLEL_MIN_PAGES,
+            progress=progress,
+            diff_dir=diff_dir,
+            diff_dpi=config.DIFF_PREVIEW_DPI,
+            input_hash=input_hash,
+            candidate_pages=candidate_pages,
+            ocr_cache_dir=config.OCR_CACHE_DIR,
+            **params,
         )
+    except ExecutorBusy:
+        raise
+    except Exception:
+        metrics.redaction_failures.inc()
+        raise
+    try:
+        sizes = os.path.getsize(params["input_path"]), os.path.getsize(output_path)
+    except OSError:
+        sizes = (None, None)
+    record_redaction_metrics(report, *sizes)
+
+    # Paths and timings are specific to this run, so they aren't cached
+    report = {k: v for k, v in report.items() if k not in ("output_path", "page_timings")}
+    if cache_key is not None:
+        cached_report = {k: v for k, v in report.items() if k != "timings"}
+        try:
+            await run_in_threadpool(result_cache.put, cache_key, str(output_path), cached_report)
+        except OSError as e:
+            logger.warning("Failed to cache redaction result: %s", e)
+    return {**report, "cached": False}
+
+# --- Endpoint: Redact file with manual inputs and keyword search ---
+@app.post("/redact/")
+async def redact_with_manual(request: RedactionRequest, http_request: Request, response: Response):
+    params = await prepare_redaction(request)
+    output_path = OUTPUT_DIR / f"redacted_{sanitize_filename(request.filename)}"
+
+    # Redact into a private file, then store it and point the output name at it
+    staging = Path(await run_in_threadpool(output_store.staging_path, ".pdf"))
+    diff_staging = await run_in_threadpool(new_diff_dir) if params["preview_diff"] else None
+    try:
+        report = await run_redaction(params, staging, diff_dir=diff_staging)
+        output_id = await run_in_threadpool(publish, output_store, staging, output_path)
+        if diff_staging:
+            await run_in_threadpool(keep_diff, diff_staging, output_id)
+    except ExecutorBusy:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Redaction failed: {str(e)}")
+    finally:
+        if staging.exists():
+            os.remove(staging)
+        if diff_staging:
+            shutil.rmtree(diff_staging, ignore_errors=True)
 
-    return {
+    if http_request.headers.get("x-redaction-timing") and "timings" in report:
+        response.headers["X-Redaction-Timing"] = format_timing_header(report["timings"])
+
+    result = {
         "message": "Manual redaction complete",
         "redacted_file": str(output_path.name),
-        "boxes": request.manual_boxes
+        "output_id": output_id,
+        "boxes": request.manual_boxes,
+        "pages_modified": report["pages_modified"],
+        "save_options": report["save_options"],
+        "cached": report["cached"],
     }
+    if request.verify:
+        result["verification"] = report.get("verification")
+    if request.preview_diff:
+        result["diff"] = list_diff(output_id, f"/redact/diff/{output_id}")
+    return result
+
+# --- Endpoint: Dry run: per-keyword and per-pattern hits, without writing output ---
+@app.post("/redact/preview")
+async def preview_redaction(request: RedactionRequest):
+    params = await prepare_redaction(request)
+    input_hash = await run_in_threadpool(sha256_file, params["input_path"])
+    # Only the search matters here, so the text index can narrow the pages even with image removal on
+    candidate_pages = await run_in_threadpool(
+        index_candidates, {**params, "remove_images": False, "image_hashes": None}, input_hash
+    )
+
+    try:
+        result = await redaction_executor.run(
+            find_matches,
+            params["input_path"],
+            params["keywords"],
+            pages=params["pages"],
+            patterns=params["patterns"],
+            input_hash=input_hash,
+            candidate_pages=candidate_pages,
+            ocr=params["ocr"],
+            ocr_dpi=params["ocr_dpi"],
+            ocr_language=params["ocr_language"],
+            ocr_cache_dir=config.OCR_CACHE_DIR,
+        )
+    except ExecutorBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+    total = sum(entry["total"] for entry in result["keywords"] + result["patterns"])
+    return {"filename": sanitize_filename(request.filename), "total_matches": total, **result}
+
+# --- Endpoint: Modified pages of a redaction and their before/after renders ---
+@app.get("/redact/diff/{filename}")
+async def get_redaction_diff(filename: str):
+    # Links use the output_id, so they keep showing this output if the name is reused
+    output_id = output_id_for(filename)
+    return list_diff(output_id, f"/redact/diff/{output_id}")
+
+@app.get("/redact/diff/{filename}/{page}/{side}")
+async def get_redaction_diff_image(filename: str, page: int, side: str):
+    return diff_image(output_id_for(filename), page, side)
+
+# --- Endpoint: Redact a PDF sent with the request and return it, without uploads/ ---
+@app.post("/redact/stream")
+async def redact_stream(request: Request):
+    """
+    Multipart form with a "file" part (the PDF) and a "policy" part holding
+    the same JSON as /redact/ (filename optional). Files up to
+    REDACTION_STREAM_SPILL_BYTES are received, redacted and returned from
+    memory; larger ones are spilled to temporary files on disk.
+    """
+    try:
+        form = await SpillingMultiPartParser(
+            request.headers, request.stream(), max_files=1, max_fields=1,
+            max_part_size=1024 * 1024,
+        ).parse()
+    except MultiPartException as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+    try:
+        file = form.get("file")
+        if not isinstance(file, FormFile):
+            raise HTTPException(status_code=422, detail="A 'file' part with the PDF is required.")
+        if file.size is not None and file.size > config.UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="File too large.")
+        filename = sanitize_filename(file.filename or "document.pdf")
+
+        try:
+            policy = json.loads(form.get("policy") or "{}")
+            if not isinstance(policy, dict):
+                raise ValueError("expected a JSON object")
+            policy.setdefault("filename", filename)
+            policy = RedactionRequest(**policy)
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid policy: {str(e)}")
+        params = await validate_policy(policy)
+        if params["preview_diff"] or params["ocr"] or params["linearize"]:
+            raise HTTPException(status_code=422, detail="preview_diff, ocr and linearize are not supported by /redact/stream.")
+
+        headers = {"content-disposition": f'attachment; filename="redacted_{filename}"'}
+        if file.size is not None and file.size > config.REDACTION_STREAM_SPILL_BYTES:
+            return await redact_spilled(file, params, headers)
+
+        data = await file.read()
+    finally:
+        await form.close()
+
+    try:
+        # Only the options redact_bytes supports; the others were rejected above
+        output, report = await redaction_executor.run(redact_bytes, data, **{
+            k: v for k, v in params.items()
+            if k not in ("preview_diff", "ocr", "ocr_dpi", "ocr_language", "linearize")
+        })
+    except ExecutorBusy:
+        raise
+    except Exception as e:
+        metrics.redaction_failures.inc()
+        raise HTTPException(status_code=500, detail=f"Redaction failed: {str(e)}")
+    record_redaction_metrics(report, len(data), len(output))
+
+    headers["x-pages-modified"] = ",".join(map(str, report["pages_modified"]))
+    if report.get("verification") is not None:
+        headers["x-redaction-verified"] = "passed" if report["verification"]["passed"] else "failed"
+    return Response(content=output, media_type="application/pdf", headers=headers)
+
+# --- Endpoint: Redact many files with one shared policy, returned as a ZIP ---
+@app.post("/redact/batch")
+async def redact_batch(request: BatchRedactionRequest):
+    if not request.filenames:
+        raise HTTPException(status_code=422, detail="At least one filename is required.")
+
+    # Validate everything up front so a bad entry fails before any work starts
+    filenames = list(dict.fromkeys(sanitize_filename(f) for f in request.filenames))
+    boxes_by_file = {sanitize_filename(k): v for k, v in (request.manual_boxes or {}).items()}
+    # Only the fields the client set, so a policy_id isn't mistaken for a conflict
+    shared = request.model_dump(exclude_unset=True, exclude={"filenames", "manual_boxes"})
+    jobs = {}
+    for filename in filenames:
+        jobs[filename] = await prepare_redaction(RedactionRequest(
+            filename=filename,
+            manual_boxes=boxes_by_file.get(filename),
+            **shared,
+        ))
+
+    # Keep at most one file per worker in flight so the batch doesn't fill the queue
+    limit = asyncio.Semaphore(redaction_executor.max_workers)
+
+    async def redact_one(filename: str) -> tuple[str, str]:
+        output_path = OUTPUT_DIR / f"redacted_{filename}"
+        staging = Path(await run_in_threadpool(output_store.staging_path, ".pdf"))
+        diff_staging = await run_in_threadpool(new_diff_dir) if jobs[filename]["preview_diff"] else None
+        try:
+            async with limit:
+                while True:
+                    try:
+                        await run_redaction(jobs[filename], staging, diff_dir=diff_staging)
+                        break
+                    except ExecutorBusy as e:
+                        await asyncio.sleep(e.retry_after)
+            digest = await run_in_threadpool(publish, output_store, staging, output_path)
+            if diff_staging:
+                await run_in_threadpool(keep_diff, diff_staging, digest)
+            # The stored object, not the name, which another request may repoint
+            return output_store.path(digest), output_path.name
+        finally:
+            if staging.exists():
+                os.remove(staging)
+            if diff_staging:
+                shutil.rmtree(diff_staging, ignore_errors=True)
+
+    results = await asyncio.gather(*(redact_one(f) for f in filenames), return_exceptions=True)
+
+    outputs, errors = [], {}
+    for filename, result in zip(filenames, results):
+        if isinstance(result, BaseException):
+            errors[filename] = str(result)
+        else:
+            outputs.append(result)
+    if not outputs:
+        raise HTTPException(status_code=500, detail={"message": "Redaction failed.", "errors": errors})
+
+    zip_path = await run_in_threadpool(build_zip, outputs, errors)
+    return FileResponse(
+        path=zip_path,
+        filename="redacted_pdfs.zip",
+        media_type="application/zip",
+        background=BackgroundTask(os.remove, zip_path),
+    )
+
+# --- Job runner handler: redact a queued job into outputs/jobs ---
+async def run_job(job: dict) -> str:
+    staging = Path(await run_in_threadpool(output_store.staging_path, ".pdf"))
+    progress = ProgressReporter(job_store.path, job["id"])
+    params = {k: v for k, v in job["params"].items() if k != "filename"}
+    diff_staging = await run_in_threadpool(new_diff_dir) if params.get("preview_diff") else None
+    try:
+        await run_redaction(params, staging, progress=progress, diff_dir=diff_staging)
+        digest = await run_in_threadpool(output_store.put, str(staging), {"job_id": job["id"]})
+        if diff_staging:
+            await run_in_threadpool(keep_diff, diff_staging, digest)
+    finally:
+        if staging.exists():
+            os.remove(staging)
+        if diff_staging:
+            shutil.rmtree(diff_staging, ignore_errors=True)
+    # Served from the store until it is collected, then the result is gone (410)
+    return output_store.path(digest)
+
+job_runner = JobRunner(job_store, run_job, config.JOB_CONCURRENCY)
+
+def job_filename(job: dict) -> str:
+    return job["params"].get("filename") or os.path.basename(job["params"]["input_path"])
+
+# --- Endpoint: Find the pages (and positions) of words and phrases in an upload ---
+@app.get("/search/{filename}")
+async def search(filename: str, q: list[str] = Query(...)):
+    """
+    Case-insensitive search for each `q` as a sequence of whole words. The
+    page text index is built first if the file hasn't been indexed yet.
+    """
+    path = uploaded_path(filename)
+    digest = await run_in_threadpool(sha256_file, str(path))
+    try:
+        await ensure_index(path, digest)
+    except ExecutorBusy:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Could not index PDF: {str(e)}")
+
+    index = await run_in_threadpool(TextIndex.load, config.TEXT_INDEX_DIR, digest)
+    if index is None:
+        raise HTTPException(status_code=500, detail="Text index could not be read.")
+    try:
+        results = {query: index.search(query) for query in dict.fromkeys(q)}
+    finally:
+        index.close()
+    return {
+        "filename": sanitize_filename(filename),
+        "page_count": index.page_count,
+        "pages": sorted({hit["page"] for hits in results.values() for hit in hits}),
+        "results": results,
+    }
+
+# --- Endpoint: Save a named redaction policy as a new version ---
+@app.post("/policies", status_code=201)
+async def create_policy(request: PolicyRequest):
+    """
+    Redact calls can then send {"filename", "policy_id"} (plus manual boxes)
+    instead of the rules. Saving under an existing name adds a version.
+    """
+    if not re.fullmatch(r"[A-Za-z0-9_.-]{1,64}", request.name):
+        raise HTTPException(status_code=422, detail="name must be 1-64 letters, digits, '_', '.' or '-'.")
+    # Reject bad rules now rather than on first use
+    rules = compile_rules(request)
+    body = request.model_dump(exclude={"name"}, exclude_unset=True)
+    version = await run_in_threadpool(policy_store.create, request.name, body)
+    compiled_policies[(request.name, version)] = rules
+    return {"policy_id": request.name, "version": version, "policy": body}
+
+# --- Endpoint: A saved policy (latest version unless ?version= is given) ---
+@app.get("/policies/{name}")
+async def get_policy(name: str, version: Optional[int] = None):
+    policy = await run_in_threadpool(policy_store.get, name, version)
+    if policy is None:
+        raise HTTPException(status_code=404, detail="Policy not found.")
+    versions = await run_in_threadpool(policy_store.versions, name)
+    return {
+        "policy_id": name,
+        "version": policy["version"],
+        "versions": versions,
+        "policy": policy["body"],
+        "created_at": policy["created_at"],
+    }
+
+# --- Endpoint: Queue a redaction job and return its id immediately ---
+@app.post("/jobs", status_code=202)
+async def create_job(request: RedactionRequest):
+    params = await prepare_redaction(request)
+    # input_path is the stored object, so keep the name the client knows it by
+    params["filename"] = sanitize_filename(request.filename)
+    job_id = await run_in_threadpool(job_store.create, params)
+    job_runner.notify()
+    return {"job_id": job_id, "state": QUEUED}
+
+# --- Endpoint: Job state and page progress ---
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {
+        "job_id": job["id"],
+        "state": job["state"],
+        "filename": job_filename(job),
+        "progress": {"pages_done": job["pages_done"], "pages_total": job["pages_total"]},
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+# --- Endpoint: Download the output of a finished job ---
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, request: Request):
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job["state"] != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job['state']}.")
+    if not job["result_path"] or not os.path.exists(job["result_path"]):
+        raise HTTPException(status_code=410, detail="Job result is no longer available.")
+
+    return await serve_pdf(request, Path(job["result_path"]), f"redacted_{job_filename(job)}")
+
+# --- Endpoint: Before/after renders of the pages a finished job modified ---
+@app.get("/jobs/{job_id}/diff")
+async def get_job_diff(job_id: str):
+    return list_diff(await job_output_id(job_id), f"/jobs/{job_id}/diff")
+
+@app.get("/jobs/{job_id}/diff/{page}/{side}")
+async def get_job_diff_image(job_id: str, page: int, side: str):
+    return diff_image(await job_output_id(job_id), page, side)
+
+# --- Endpoint: Prometheus metrics ---
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# --- Endpoint: Result cache statistics ---
+@app.get("/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
+# --- Endpoint: Page count and page sizes of an uploaded PDF ---
+@app.get("/preview/{filename}")
+async def preview_info(filename: str, response: Response):
+    path = uploaded_path(filename)
+    digest = await run_in_threadpool(sha256_file, str(path))
+    info = await get_document_info(path, digest)
+    response.headers["X-Page-Count"] = str(info["page_count"])
+    return {"filename": sanitize_filename(filename), "sha256": digest, **info}
+
+# --- Endpoint: Render a page of an uploaded PDF as an image ---
+@app.get("/preview/{filename}/{page}")
+async def preview_page(filename: str, page: int, request: Request, dpi: int = 72,
+                       w: Optional[int] = None, format: str = "png"):
+    """
+    Page numbers are 0-indexed, like manual box pages. `w` renders the page
+    exactly that many pixels wide and takes precedence over `dpi`.
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of: {', '.join(FORMATS)}.")
+    if not 18 <= dpi <= 300:
+        raise HTTPException(status_code=422, detail="dpi must be between 18 and 300.")
+    if w is not None and not 16 <= w <= 4000:
+        raise HTTPException(status_code=422, detail="w must be between 16 and 4000.")
+
+    path = uploaded_path(filename)
+    digest = await run_in_threadpool(sha256_file, str(path))
+    info = await get_document_info(path, digest)
+    page_count = info["page_count"]
+    if not 0 <= page < page_count:
+        raise HTTPException(status_code=404, detail=f"Page {page} not found (document has {page_count} pages).")
+
+    key = (digest, page, 0 if w else dpi, w or 0, format)
+    headers = {
+        "etag": f'"{digest}-{page}-{key[2]}-{key[3]}.{format}"',
+        "cache-control": "private, no-cache",
+        "x-page-count": str(page_count),
+    }
+    if request.headers.get("if-none-match") and not_modified(request, headers["etag"], 0):
+        return Response(status_code=304, headers=headers)
+
+    data = await render_preview(path, key)
+
+    # Warm the neighbouring pages so paging through the document is instant
+    for n in range(1, config.PREVIEW_PREFETCH + 1):
+        for neighbour in (page + n, page - n):
+            if 0 <= neighbour < page_count:
+                schedule_prefetch(path, (digest, neighbour, *key[2:]))
+
+    return Response(content=data, media_type=FORMATS[format], headers=headers)
 
 # --- Endpoint: Download redacted PDF ---
 @app.get("/download/{filename}")
-async def download_file(filename: str):
+async def download_file(filename: str, request: Request):
+    # An output_id from /redact/ addresses the stored output itself
+    if is_object_key(filename):
+        path = await run_in_threadpool(output_store.path, filename)
+        if path is not None:
+            return await serve_pdf(request, Path(path), f"redacted_{filename}.pdf")
+
     safe_filename = sanitize_filename(filename)
     file_path = OUTPUT_DIR / f"redacted_{safe_filename}"
 
@@ -115,36 +836,434 @@ async def download_file(filename: str):
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Redacted file not found.")
 
+    return await serve_pdf(request, file_path, file_path.name)
+
+# --- Helper: Serve a PDF with a content-hash ETag, conditional GET, Range and gzip ---
+async def serve_pdf(request: Request, path: Path, filename: str) -> Response:
+    """
+    The ETag is the SHA-256 of the file, so it only changes when the content
+    does. A matching If-None-Match (or an If-Modified-Since not older than
+    the file) gets 304. Otherwise FileResponse serves the file and answers
+    Range requests with 206. If DOWNLOAD_GZIP is enabled and the client
+    accepts gzip, whole-file downloads are compressed on the fly.
+    """
+    stat_result = await run_in_threadpool(os.stat, path)
+    digest = await run_in_threadpool(sha256_file, str(path))
+    etag = f'"{digest}"'
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": "private, no-cache",
+    }
+    if config.DOWNLOAD_GZIP:
+        headers["vary"] = "Accept-Encoding"
+
+    if not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    accepts_gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    if config.DOWNLOAD_GZIP and accepts_gzip and "range" not in request.headers:
+        # The compressed body is a different representation, so it gets its own ETag
+        headers["etag"] = f'"{digest}-gzip"'
+        headers["content-encoding"] = "gzip"
+        headers["content-disposition"] = f'attachment; filename="{filename}"'
+        return StreamingResponse(gzip_file(path), media_type="application/pdf", headers=headers)
+
     return FileResponse(
-        path=file_path,
-        filename=file_path.name,
-        media_type="application/pdf"
+        path=path,
+        filename=filename,
+        media_type="application/pdf",
+        headers=headers,
+        stat_result=stat_result,
     )
 
-# --- Helper: Parse page range like "1-3,5" into [0, 1, 2, 4] (0-indexed) ---
-def parse_page_range(range_str: str) -> list[int]:
-    if not range_str:
-        return []
+# --- Helper: Build the page text index of an upload once, sharing concurrent builds ---
+async def ensure_index(path: Path, digest: str):
+    if index_path(config.TEXT_INDEX_DIR, digest).exists():
+        # Indexes from an older INDEX_VERSION (or damaged ones) are rebuilt
+        index = await run_in_threadpool(TextIndex.load, config.TEXT_INDEX_DIR, digest)
+        if index is not None:
+            index.close()
+            return
+    task = index_builds.get(digest)
+    if task is None:
+        task = asyncio.ensure_future(
+            redaction_executor.run(build_index, str(path), digest, config.TEXT_INDEX_DIR)
+        )
+        index_builds[digest] = task
+        task.add_done_callback(lambda _: index_builds.pop(digest, None))
+    await asyncio.shield(task)
 
-    pages = set()
-    parts = range_str.split(',')
+def log_index_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Building the text index failed: %s", task.exception())
 
-    for part in parts:
-        part = part.strip()
-        if not part:
-            continue
-        if '-' in part:
-            try:
-                start, end = map(int, part.split('-'))
-                if start > end:
-                    raise ValueError("Start of range cannot be greater than end.")
-                pages.update(range(start - 1, end))  # 0-indexed
-            except:
-                raise ValueError(f"Invalid range segment: '{part}'")
-        else:
+# --- Helper: Pages a redaction can change, according to the text index ---
+def index_candidates(params: dict, input_hash: str) -> Optional[list[int]]:
+    """
+    Returns None (visit every selected page) unless the file is indexed and
+    every way the request can change a page is known from the index: keywords,
+    manual boxes and pre-existing redact annotations. Patterns, image
+    removal and OCR need the pages themselves.
+    """
+    if params["patterns"] or params["remove_images"] or params.get("image_hashes") or params.get("ocr"):
+        return None
+    index = TextIndex.load(config.TEXT_INDEX_DIR, input_hash)
+    if index is None:
+        return None
+    try:
+        pages = set(index.redact_annot_pages)
+        # (boxes with a malformed page are dropped by the redaction)
+        pages.update(box.get("page") for box in params["manual_boxes"] or [])
+        pages = {page for page in pages if isinstance(page, int)}
+        for keyword in params["keywords"]:
+            keyword_pages = index.candidate_pages(keyword)
+            if keyword_pages is None:
+                return None
+            pages |= keyword_pages
+    finally:
+        index.close()
+    return sorted(pages)
+
+# --- Helper: A private directory for the diff renders of a redaction in progress ---
+def new_diff_dir() -> Path:
+    return Path(tempfile.mkdtemp(dir=DIFF_DIR, prefix=".new-"))
+
+# --- Helper: Keep the diff renders of a stored output under its output_id ---
+def keep_diff(staging: Path, output_id: str):
+    try:
+        os.rename(staging, DIFF_DIR / output_id)
+    except OSError:
+        # An identical output already has its renders
+        shutil.rmtree(staging, ignore_errors=True)
+
+# --- Helper: Where the diff renders of a stored output live ---
+def diff_dir_for(output_id: str) -> Optional[Path]:
+    return DIFF_DIR / output_id if is_object_key(output_id) else None
+
+# --- Helper: The output_id a /redact/ output name (or an output_id) refers to ---
+def output_id_for(filename: str) -> str:
+    if is_object_key(filename):
+        return filename
+    # Output names are links to the stored object, which is named by its hash
+    return os.path.basename(os.path.realpath(OUTPUT_DIR / f"redacted_{sanitize_filename(filename)}"))
+
+# --- Helper: The output_id of a job's result, or raise 404 ---
+async def job_output_id(job_id: str) -> str:
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return os.path.basename(job["result_path"] or "")
+
+# --- Helper: List the pages of a diff directory with links to their renders ---
+def list_diff(output_id: str, base_url: str) -> dict:
+    diff_dir = diff_dir_for(output_id)
+    if diff_dir is None or not diff_dir.is_dir():
+        raise HTTPException(status_code=404, detail="No diff preview for this redaction; redact with preview_diff enabled.")
+    pages = sorted(int(p.name.split("-")[0]) for p in diff_dir.glob("*-after.png"))
+    return {
+        "pages_modified": pages,
+        "dpi": config.DIFF_PREVIEW_DPI,
+        "pages": [
+            {"page": i, "before": f"{base_url}/{i}/before", "after": f"{base_url}/{i}/after"}
+            for i in pages
+        ],
+    }
+
+# --- Helper: Serve one before/after render ---
+def diff_image(output_id: str, page: int, side: str) -> FileResponse:
+    if side not in ("before", "after"):
+        raise HTTPException(status_code=422, detail="side must be 'before' or 'after'.")
+    diff_dir = diff_dir_for(output_id)
+    path = diff_dir / f"{page}-{side}.png" if diff_dir else None
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Diff image not found.")
+    return FileResponse(path=path, media_type="image/png", headers={"cache-control": "private, no-cache"})
+
+# --- Helper: Resolve an uploaded file (by name or file_id) or raise 404 ---
+def uploaded_path(filename: str) -> Path:
+    """
+    The stored object the upload refers to right now. A name is a link that
+    the next upload under that name repoints, so it is resolved here, once:
+    queued jobs and batches keep redacting the content they were given.
+    """
+    if is_object_key(filename):
+        path = upload_store.path(filename)
+        if path is not None:
+            return Path(path)
+    path = UPLOAD_DIR / sanitize_filename(filename)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="File not found in uploads directory.")
+    return Path(os.path.realpath(path))
+
+# --- Helper: Page count and sizes, remembered per content hash ---
+async def get_document_info(path: Path, digest: str) -> dict:
+    info = document_infos.get(digest)
+    if info is None:
+        try:
+            info = await preview_executor.run(document_info, str(path), digest)
+        except ExecutorBusy:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Could not open PDF: {str(e)}")
+        if len(document_infos) >= 1024:
+            document_infos.pop(next(iter(document_infos)))
+        document_infos[digest] = info
+    return info
+
+# --- Helper: Cached page render; concurrent requests for one page share a render ---
+async def render_preview(path: Path, key: tuple) -> bytes:
+    data = await run_in_threadpool(preview_cache.get, key)
+    if data is not None:
+        return data
+
+    task = preview_renders.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_render_and_store(path, key))
+        preview_renders[key] = task
+        task.add_done_callback(lambda _: preview_renders.pop(key, None))
+    # Shield so one client going away doesn't cancel a render others wait on
+    return await asyncio.shield(task)
+
+async def _render_and_store(path: Path, key: tuple) -> bytes:
+    digest, page, dpi, width, fmt = key
+    data = await preview_executor.run(render_page, str(path), digest, page, dpi, width, fmt)
+    try:
+        await run_in_threadpool(preview_cache.put, key, data)
+    except OSError as e:
+        logger.warning("Failed to cache page preview: %s", e)
+    return data
+
+# --- Helper: Render a page in the background if a worker is idle ---
+def schedule_prefetch(path: Path, key: tuple):
+    if key in preview_renders or preview_executor.pending >= preview_executor.max_workers:
+        return
+
+    async def prefetch():
+        try:
+            await render_preview(path, key)
+        except Exception as e:
+            logger.debug("Preview prefetch failed: %s", e)
+
+    task = asyncio.create_task(prefetch())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+# --- Helper: Evaluate If-None-Match / If-Modified-Since ---
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as RFC 9110 asks for If-None-Match
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or etag[:-1] + '-gzip"' in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+# --- Helper: Gzip a file in chunks without holding it in memory ---
+async def gzip_file(path: Path):
+    compressor = zlib.compressobj(config.DOWNLOAD_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with open(path, "rb") as f:
+        while True:
+            chunk = await run_in_threadpool(f.read, 256 * 1024)
+            if not chunk:
+                break
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
+
+# --- Helper: Multipart parser that keeps files in memory up to the spill threshold ---
+class SpillingMultiPartParser(MultiPartParser):
+    spool_max_size = config.REDACTION_STREAM_SPILL_BYTES
+
+# --- Helper: /redact/stream for a file that was spilled to disk ---
+async def redact_spilled(file: FormFile, params: dict, headers: dict) -> FileResponse:
+    """
+    The spooled upload has no name on disk, so copy it to a temp file and
+    take the regular path, then stream the output and remove both files.
+    """
+    tmp = await run_in_threadpool(
+        tempfile.NamedTemporaryFile, dir=UPLOAD_DIR, prefix=".stream-", suffix=".pdf", delete=False
+    )
+    input_path = Path(tmp.name)
+    output_path = OUTPUT_DIR / f".stream-{input_path.stem}.pdf"
+
+    def cleanup():
+        for path in (input_path, output_path):
+            if path.exists():
+                os.remove(path)
+
+    try:
+        await file.seek(0)
+        while True:
+            chunk = await file.read(config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            await run_in_threadpool(tmp.write, chunk)
+        await run_in_threadpool(tmp.close)
+        report = await run_redaction({**params, "input_path": str(input_path)}, output_path)
+    except (ExecutorBusy, HTTPException):
+        tmp.close()
+        cleanup()
+        raise
+    except Exception as e:
+        tmp.close()
+        cleanup()
+        raise HTTPException(status_code=500, detail=f"Redaction failed: {str(e)}")
+
+    headers["x-pages-modified"] = ",".join(map(str, report["pages_modified"]))
+    if report.get("verification") is not None:
+        headers["x-redaction-verified"] = "passed" if report["verification"]["passed"] else "failed"
+    return FileResponse(
+        path=output_path,
+        media_type="application/pdf",
+        headers=headers,
+        background=BackgroundTask(cleanup),
+    )
+
+# --- Helper: Move a finished file into a store and point a name at it ---
+def publish(store: ObjectStore, src: Path, alias: Path, digest: str = None, meta: dict = None) -> str:
+    digest = store.put(str(src), meta, digest)
+    link(alias, store.path(digest))
+    return digest
+
+# --- Helper: Delete expired and over-quota uploads and outputs in the background ---
+async def collect_garbage():
+    while True:
+        await asyncio.sleep(config.STORAGE_GC_INTERVAL)
+        try:
+            await run_in_threadpool(run_storage_gc)
+        except Exception:
+            logger.exception("Storage garbage collection failed")
+
+def run_storage_gc():
+    removed = upload_store.gc() + output_store.gc()
+    # Names whose object was collected now dangle
+    pruned = prune_links(UPLOAD_DIR) + prune_links(OUTPUT_DIR)
+    prune_diff_staging()
+    if removed or pruned:
+        logger.info("Storage GC removed %d objects and %d names", removed, pruned)
+
+# --- Helper: Remove diff renders abandoned by redactions that crashed ---
+def prune_diff_staging():
+    day_ago = time.time() - 24 * 3600
+    for entry in os.scandir(DIFF_DIR):
+        if entry.name.startswith(".new-"):
             try:
-                pages.add(int(part) - 1)
-            except:
-                raise ValueError(f"Invalid page number: '{part}'")
+                if entry.stat().st_mtime < day_ago:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
 
-    return sorted(pages)
\ No newline at end of file
+# --- Helper: Stream an upload to disk in chunks, hashing it on the way ---
+async def save_upload(file: UploadFile, dest: Path) -> tuple[int, str]:
+    """
+    Copy the upload to a temp file next to `dest` in fixed-size chunks and
+    rename it into place once complete, so memory use stays flat and readers
+    never see a partial file. Returns the size and SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp = await run_in_threadpool(
+        tempfile.NamedTemporaryFile, dir=dest.parent, prefix=".upload-", delete=False
+    )
+    try:
+        while True:
+            chunk = await file.read(config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > config.UPLOAD_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="File too large.")
+            digest.update(chunk)
+            await run_in_threadpool(tmp.write, chunk)
+        await run_in_threadpool(tmp.close)
+        await run_in_threadpool(os.replace, tmp.name, dest)
+    except BaseException:
+        tmp.close()
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        raise
+    return size, digest.hexdigest()
+
+# --- Helper: Pack redacted outputs (and any per-file errors) into a temp ZIP ---
+def build_zip(files: list[tuple[str, str]], errors: dict) -> str:
+    fd, zip_path = tempfile.mkstemp(suffix=".zip", dir=OUTPUT_DIR, prefix=".batch-")
+    os.close(fd)
+    try:
+        # PDFs are already compressed, so store them as-is
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zipf:
+            for path, name in files:
+                zipf.write(path, name)
+            if errors:
+                zipf.writestr("errors.json", json.dumps(errors, indent=2))
+    except BaseException:
+        os.remove(zip_path)
+        raise
+    return zip_path
+
+# --- Helper: Feed a redaction report into the metrics registry ---
+def record_redaction_metrics(report: dict, size_in: int = None, size_out: int = None):
+    timings = report["timings"]
+    metrics.redaction_latency.observe(timings["total"])
+    for stage, seconds in timings["stages"].items():
+        metrics.stage_seconds.observe(seconds, stage=stage)
+    for stages in report["page_timings"].values():
+        for stage, seconds in stages.items():
+            metrics.page_stage_seconds.observe(seconds, stage=stage)
+
+    metrics.pages_processed.inc(report["pages_processed"])
+    metrics.pages_modified.inc(len(report["pages_modified"]))
+    if timings["total"] > 0:
+        metrics.pages_per_second.set(report["pages_processed"] / timings["total"])
+    if size_in is not None:
+        metrics.bytes_in.inc(size_in)
+        metrics.document_bytes.observe(size_in)
+    if size_out is not None:
+        metrics.bytes_out.inc(size_out)
+
+# --- Helper: Render stage timings as "stage=ms;..." for X-Redaction-Timing ---
+def format_timing_header(timings: dict) -> str:
+    parts = [f"{stage}={seconds * 1000:.1f}" for stage, seconds in timings["stages"].items()]
+    parts.append(f"total={timings['total'] * 1000:.1f}")
+    return ";".join(parts)
+
+# --- Helper: Normalize redaction parameters into a stable cache key payload ---
+def normalize_redaction_params(params: dict) -> dict:
+    # Malformed values (dropped by the redaction) sort after numbers instead
+    # of failing, and valid boxes keep the order of earlier keys
+    boxes = sorted(
+        ((box["page"], box["x0"], box["y0"], box["x1"], box["y1"])
+         for box in params["manual_boxes"] or []),
+        key=lambda box: [(0, v) if isinstance(v, (int, float)) else (1, repr(v)) for v in box],
+    )
+    normalized = {
+        "keywords": sorted({normalize_keyword(k) for k in params["keywords"]} - {""}),
+        "patterns": list(normalize_patterns(params["patterns"])),
+        "pages": sorted(set(params["pages"])),
+        "remove_images": bool(params["remove_images"]),
+        "manual_boxes": boxes,
+        "save_mode": params["save_mode"],
+        "linearize": bool(params["linearize"]),
+    }
+    # Only present when used, so keys of earlier results stay valid
+    if params.get("ocr"):
+        normalized["ocr"] = [params["ocr_dpi"], params["ocr_language"]]
+    if params["remove_images"] and (params.get("image_mode", "all") != "all" or params.get("image_min_size")):
+        normalized["images"] = [params["image_mode"], params["image_min_size"]]
+    if params.get("image_hashes"):
+        normalized["image_hashes"] = params["image_hashes"]
+    if params.get("verify"):
+        normalized["verify"] = True
+    if params.get("placeholder", DEFAULT_PLACEHOLDER) != DEFAULT_PLACEHOLDER:
+        normalized["placeholder"] = params["placeholder"]
+    if list(params.get("fill", DEFAULT_FILL)) != list(DEFAULT_FILL):
+        normalized["fill"] = list(params["fill"])
+    return normalized
@@ -0,0 +1,290 @@
+"""
+Bulk redaction of a folder of PDFs without the HTTP service:
+
+    python -m app.cli INPUT_DIR OUTPUT_DIR --policy policy.json [--watch]
+
+The policy file holds the same JSON as POST /policies (without "name").
+Every finished input is appended to a JSONL manifest in OUTPUT_DIR, and
+inputs the manifest already lists as done are skipped, so an interrupted
+run picks up where it stopped. An input with the same content as one
+redacted before gets a copy of that output, recorded as a "duplicate".
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from app import config
+from app.hashing import sha256_file
+from app.policies import compile_policy
+from app.redaction import redact_text
+
+logger = logging.getLogger("app.cli")
+
+# Prefix of outputs still being written; leftovers of a crash are removed on start
+_PARTIAL_PREFIX = ".partial-"
+
+
+class Manifest:
+    """
+    Append-only JSONL log of processed inputs. Each line is flushed and
+    synced before the next input finishes, so after a crash the manifest
+    lists exactly the outputs that were completely written.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.done = {}  # content hash -> entry of the input redacted successfully
+        self.recorded = set()  # (input, content hash) of inputs that need no more work
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash; that input is simply redone
+                        continue
+                    self._index(entry)
+        except FileNotFoundError:
+            pass
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, entry: dict):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._index(entry)
+
+    def _index(self, entry: dict):
+        if entry.get("status") == "ok":
+            self.done[entry["sha256"]] = entry
+        if entry.get("status") in ("ok", "duplicate"):
+            self.recorded.add((entry["input"], entry["sha256"]))
+
+    def close(self):
+        self._file.close()
+
+
+def _ignore_interrupts():
+    """Worker initializer: Ctrl+C is handled by the main process alone."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _redact_file(input_path: str, output_path: str, digest: str, rules: dict) -> dict:
+    """Worker: redact one file to a partial name and move it into place when complete."""
+    output = Path(output_path)
+    partial = output.with_name(_PARTIAL_PREFIX + output.name)
+    report = redact_text(input_path, str(partial), input_hash=digest,
+                         ocr_cache_dir=config.OCR_CACHE_DIR, **rules)
+    os.replace(partial, output)
+    return {k: v for k, v in report.items() if k not in ("output_path", "page_timings")}
+
+
+def scan(input_dir: Path, settle: float) -> list[Path]:
+    """
+    PDFs in input_dir, oldest first. Files modified within the last `settle`
+    seconds may still be being copied in and are left for a later scan.
+    """
+    now = time.time()
+    found = []
+    for path in input_dir.iterdir():
+        if path.name.startswith(".") or path.suffix.lower() != ".pdf" or not path.is_file():
+            continue
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if now - mtime >= settle:
+            found.append((mtime, path))
+    return [path for _, path in sorted(found)]
+
+
+def run(input_dir: Path, output_dir: Path, rules: dict, manifest: Manifest, workers: int,
+        max_in_flight_bytes: int, watch: bool, interval: float, settle: float) -> int:
+    """
+    Redact every new input with a pool of `workers` processes. At most two
+    files per worker are queued, and no more than `max_in_flight_bytes` of
+    input (roughly what the workers hold in memory) unless it's a single
+    file. Returns the number of inputs that failed.
+    """
+    failures = 0
+    queued = set()  # (input, digest) taken on in this run, so rescans don't repeat them
+    seen = set()  # hashes submitted in this run, so duplicates are done once
+    waiting = {}  # digest -> [(input path, size, output path)] duplicates of a file in flight
+    in_flight = {}  # future -> (input path, digest, size, output path, start time)
+
+    def copy_duplicate(path, digest, size, output_path):
+        """Give a duplicate input the output of the first input with its content."""
+        nonlocal failures
+        entry = {"input": str(path), "sha256": digest, "size": size}
+        original = manifest.done.get(digest)
+        try:
+            if original is None:
+                raise RuntimeError("the input with the same content failed")
+            partial = output_path.with_name(_PARTIAL_PREFIX + output_path.name)
+            shutil.copyfile(original["output"], partial)
+            os.replace(partial, output_path)
+        except (OSError, RuntimeError) as e:
+            failures += 1
+            entry.update(status="error", error=str(e))
+            logger.error("%s: %s", path.name, e)
+        else:
+            entry.update(status="duplicate", duplicate_of=original["input"], output=str(output_path))
+            logger.info("%s: same content as %s, output copied", path.name, Path(original["input"]).name)
+        entry["finished_at"] = time.time()
+        manifest.append(entry)
+
+    def finish(future):
+        nonlocal failures
+        path, digest, size, output_path, started = in_flight.pop(future)
+        entry = {"input": str(path), "sha256": digest, "size": size,
+                 "seconds": round(time.time() - started, 3)}
+        try:
+            report = future.result()
+        except Exception as e:
+            failures += 1
+            entry.update(status="error", error=str(e))
+            logger.error("%s: %s", path.name, e)
+        else:
+            entry.update(
+                status="ok",
+                output=str(output_path),
+                pages_modified=report["pages_modified"],
+                pages_processed=report["pages_processed"],
+                matches=report["matches"],
+                verification=report["verification"],
+                timings={stage: round(s, 4) for stage, s in report["timings"]["stages"].items()},
+            )
+            logger.info("%s: %d matches, %d pages modified in %.2fs", path.name,
+                        report["matches"], len(report["pages_modified"]), entry["seconds"])
+            if report["verification"] and not report["verification"]["passed"]:
+                logger.warning("%s: verification failed, text matching the policy remains", path.name)
+        entry["finished_at"] = time.time()
+        manifest.append(entry)
+        for dup_path, dup_size, dup_output in waiting.pop(digest, []):
+            copy_duplicate(dup_path, digest, dup_size, dup_output)
+
+    def in_flight_bytes() -> int:
+        return sum(size for _, _, size, _, _ in in_flight.values())
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_ignore_interrupts) as pool:
+        try:
+            while True:
+                for path in scan(input_dir, settle if watch else 0):
+                    try:
+                        digest = sha256_file(str(path))
+                        size = path.stat().st_size
+                    except OSError as e:
+                        logger.warning("Skipping %s: %s", path, e)
+                        continue
+                    if (str(path), digest) in manifest.recorded or (str(path), digest) in queued:
+                        continue
+                    queued.add((str(path), digest))
+                    output_path = output_dir / f"redacted_{path.name}"
+                    if digest in manifest.done:
+                        copy_duplicate(path, digest, size, output_path)
+                        continue
+                    if digest in seen:
+                        # Copied once the first file with this content is done
+                        waiting.setdefault(digest, []).append((path, size, output_path))
+                        continue
+                    seen.add(digest)
+
+                    # Wait for room: a bounded number of files and bytes in flight
+                    while in_flight and (len(in_flight) >= 2 * workers
+                                         or in_flight_bytes() + size > max_in_flight_bytes):
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            finish(future)
+
+                    future = pool.submit(_redact_file, str(path), str(output_path), digest, rules)
+                    in_flight[future] = (path, digest, size, output_path, time.time())
+
+                if not watch:
+                    break
+                # Finish what completes during the pause, then look for new inputs
+                deadline = time.time() + interval
+                while in_flight and time.time() < deadline:
+                    done, _ = wait(in_flight, timeout=deadline - time.time(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future)
+                time.sleep(max(0.0, deadline - time.time()))
+        except KeyboardInterrupt:
+            # Files not started yet are left for the next run; running ones
+            # finish and are recorded below
+            for future in list(in_flight):
+                if future.cancel():
+                    in_flight.pop(future)
+            raise
+        finally:
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli",
+                                     description="Redact every PDF in a folder with one policy.")
+    parser.add_argument("input_dir", type=Path)
+    parser.add_argument("output_dir", type=Path)
+    parser.add_argument("--policy", required=True, type=Path,
+                        help="JSON file with the fields of POST /policies")
+    parser.add_argument("--manifest", type=Path,
+                        help="JSONL manifest (default: OUTPUT_DIR/manifest.jsonl)")
+    parser.add_argument("--workers", type=int, default=config.REDACTION_WORKERS,
+                        help="redaction processes (default: REDACTION_WORKERS)")
+    parser.add_argument("--max-in-flight-mb", type=int, default=1024,
+                        help="input megabytes being redacted at once (default: 1024)")
+    parser.add_argument("--verify", action="store_true",
+                        help="check each output for text the policy should have removed")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep watching INPUT_DIR for new files")
+    parser.add_argument("--interval", type=float, default=5.0,
+                        help="seconds between scans with --watch (default: 5)")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="with --watch, skip files modified in the last SETTLE seconds (default: 2)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        with open(args.policy, encoding="utf-8") as f:
+            body = json.load(f)
+        if not isinstance(body, dict):
+            raise ValueError("expected a JSON object")
+        body.pop("name", None)
+        rules = compile_policy(body)
+        rules["verify"] = args.verify
+    except (OSError, ValueError) as e:
+        parser.error(f"invalid policy {args.policy}: {e}")
+    if not args.input_dir.is_dir():
+        parser.error(f"{args.input_dir} is not a directory")
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for partial in args.output_dir.glob(_PARTIAL_PREFIX + "*"):
+        partial.unlink()
+
+    manifest = Manifest(args.manifest or args.output_dir / "manifest.jsonl")
+    try:
+        failures = run(args.input_dir, args.output_dir, rules, manifest,
+                       workers=max(1, args.workers),
+                       max_in_flight_bytes=max(1, args.max_in_flight_mb) * 1024 * 1024,
+                       watch=args.watch, interval=args.interval, settle=args.settle)
+    except KeyboardInterrupt:
+        logger.info("Interrupted; rerun to continue where this run stopped.")
+        return 130
+    finally:
+        manifest.close()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""Runtime settings for the redaction service, read from environment variables."""
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Environment variable {name} must be an integer, got {value!r}")
+
+
+# Number of worker processes used for redaction (defaults to the number of cores)
+REDACTION_WORKERS = max(1, _env_int("REDACTION_WORKERS", os.cpu_count() or 1))
+
+# How many redactions may wait for a free worker before new ones are rejected with 503
+REDACTION_QUEUE_SIZE = max(0, _env_int("REDACTION_QUEUE_SIZE", 2 * REDACTION_WORKERS))
+
+# Seconds a client is told to wait (Retry-After) when the redaction queue is full
+REDACTION_RETRY_AFTER = max(1, _env_int("REDACTION_RETRY_AFTER", 5))
+
+# Worker processes used to redact the pages of a single large document in parallel.
+# Each of the REDACTION_WORKERS may start this many, so the default is serial;
+# raise it only when REDACTION_WORKERS * REDACTION_PAGE_WORKERS fits the cores.
+REDACTION_PAGE_WORKERS = max(1, _env_int("REDACTION_PAGE_WORKERS", 1))
+
+# Documents with fewer selected pages than this are redacted serially
+REDACTION_PARALLEL_MIN_PAGES = max(2, _env_int("REDACTION_PARALLEL_MIN_PAGES", 200))
+
+# Largest accepted upload in bytes (default 1 GiB)
+UPLOAD_MAX_BYTES = max(1, _env_int("UPLOAD_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Size of the chunks uploads are streamed to disk in
+UPLOAD_CHUNK_SIZE = max(4096, _env_int("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# Where redacted outputs are cached, and how large the cache may grow (0 disables it)
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "cache/results")
+RESULT_CACHE_MAX_BYTES = max(0, _env_int("RESULT_CACHE_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Content-addressed storage of uploads and redacted outputs: backend ("local"
+# or "memory", for tests) and the directory the local backend uses
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+STORAGE_DIR = os.environ.get("STORAGE_DIR", "storage")
+
+# Stored files unused for this many seconds are deleted (0 keeps them), and each
+# store is trimmed to a size quota (0: no limit), checked every STORAGE_GC_INTERVAL seconds
+UPLOAD_TTL = max(0, _env_int("UPLOAD_TTL", 7 * 24 * 3600))
+OUTPUT_TTL = max(0, _env_int("OUTPUT_TTL", 24 * 3600))
+UPLOAD_STORE_MAX_BYTES = max(0, _env_int("UPLOAD_STORE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+OUTPUT_STORE_MAX_BYTES = max(0, _env_int("OUTPUT_STORE_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+STORAGE_GC_INTERVAL = max(10, _env_int("STORAGE_GC_INTERVAL", 600))
+
+# SQLite database holding the redaction job queue
+JOBS_DB = os.environ.get("JOBS_DB", "jobs.db")
+
+# SQLite database holding named, versioned redaction policies
+POLICIES_DB = os.environ.get("POLICIES_DB", "policies.db")
+
+# Jobs processed concurrently by each server process
+JOB_CONCURRENCY = max(1, _env_int("JOB_CONCURRENCY", REDACTION_WORKERS))
+
+# Compress downloads on the fly for clients that accept gzip (PDFs are often compressed already)
+DOWNLOAD_GZIP = _env_int("DOWNLOAD_GZIP", 0) == 1
+DOWNLOAD_GZIP_LEVEL = min(9, max(1, _env_int("DOWNLOAD_GZIP_LEVEL", 6)))
+
+# Worker processes rendering page previews, and how many renders may wait for one
+PREVIEW_WORKERS = max(1, _env_int("PREVIEW_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+PREVIEW_QUEUE_SIZE = max(0, _env_int("PREVIEW_QUEUE_SIZE", 4 * PREVIEW_WORKERS))
+
+# Rendered previews are cached on disk here, with the hottest kept in memory
+PREVIEW_CACHE_DIR = os.environ.get("PREVIEW_CACHE_DIR", "cache/previews")
+PREVIEW_MEMORY_BYTES = max(0, _env_int("PREVIEW_MEMORY_BYTES", 64 * 1024 * 1024))
+PREVIEW_CACHE_MAX_BYTES = max(0, _env_int("PREVIEW_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Pages on each side of a requested preview rendered ahead of time (0 disables it)
+PREVIEW_PREFETCH = max(0, _env_int("PREVIEW_PREFETCH", 1))
+
+# Resolution of the before/after page renders made for redaction diff previews
+DIFF_PREVIEW_DPI = min(150, max(10, _env_int("DIFF_PREVIEW_DPI", 40)))
+
+# Per worker process: parsed documents kept open for previews (by file size) and
+# extracted page text reused by repeated redactions of the same upload
+DOCUMENT_CACHE_BYTES = max(0, _env_int("DOCUMENT_CACHE_BYTES", 256 * 1024 * 1024))
+PAGE_TEXT_CACHE_BYTES = max(0, _env_int("PAGE_TEXT_CACHE_BYTES", 128 * 1024 * 1024))
+
+# Page text indexes used by /search and to skip pages in /redact/; build one for
+# every upload (1) or only when /upload is called with ?index=true (0)
+TEXT_INDEX_DIR = os.environ.get("TEXT_INDEX_DIR", "cache/index")
+TEXT_INDEX_ON_UPLOAD = _env_int("TEXT_INDEX_ON_UPLOAD", 0) == 1
+
+# OCR of scanned pages: default resolution, and where OCR text is cached
+OCR_DPI = min(600, max(72, _env_int("OCR_DPI", 300)))
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", "cache/ocr")
+
+# /redact/stream keeps request and result in memory up to this size and spills larger files to disk
+REDACTION_STREAM_SPILL_BYTES = max(0, _env_int("REDACTION_STREAM_SPILL_BYTES", 32 * 1024 * 1024))
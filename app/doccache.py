@@ -0,0 +1,104 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import fitz  # PyMuPDF for working with PDFs
+
+from app import config
+from app.matching import PageText
+
+# Rough memory per extracted character: its bbox tuple, line number and list slots
+_BYTES_PER_CHAR = 120
+
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping bounded by the total `size` of its entries rather
+    than their number. `on_evict`, if given, is called with each value that
+    is dropped, e.g. to close a document.
+    """
+
+    def __init__(self, max_bytes: int, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size: int) -> bool:
+        """Store value; returns False if it is too large to be cached at all."""
+        if size > self.max_bytes:
+            return False
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+                evicted.append(old[0])
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (value, size) = self._entries.popitem(last=False)
+                self._size -= size
+                evicted.append(value)
+        if self.on_evict is not None:
+            for value in evicted:
+                self.on_evict(value)
+        return True
+
+
+def _close(doc):
+    doc.close()
+
+
+# Per process: parsed documents for read-only use, and extracted page text
+documents = LRUCache(config.DOCUMENT_CACHE_BYTES, on_evict=_close)
+page_texts = LRUCache(config.PAGE_TEXT_CACHE_BYTES)
+
+
+@contextmanager
+def open_document(path: str, digest: str):
+    """
+    Yield a parsed document for `path`, reusing one opened earlier in this
+    process for the same content hash, so a re-uploaded file with new content
+    is never served stale. The document is shared between calls: use it
+    read-only and don't close it.
+    """
+    doc = documents.get(digest)
+    if doc is not None:
+        yield doc
+        return
+    doc = fitz.open(path)
+    if not documents.put(digest, doc, os.path.getsize(path)):
+        # Too large to keep around
+        try:
+            yield doc
+        finally:
+            doc.close()
+        return
+    yield doc
+
+
+def page_text(page, digest: str, number: int) -> PageText:
+    """PageText.from_page, cached per (content hash, page) when a hash is given."""
+    if digest is None:
+        return PageText.from_page(page)
+    key = (digest, number)
+    text = page_texts.get(key)
+    if text is None:
+        text = PageText.from_page(page)
+        page_texts.put(key, text, len(text.text) * _BYTES_PER_CHAR)
+    return text
@@ -0,0 +1,109 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app import config
+from app import metrics
+
+
+def _timed_call(fn, submitted: float):
+    """Runs in the worker: note how long the job waited, then run it."""
+    waited = time.time() - submitted
+    return waited, fn()
+
+
+class ExecutorBusy(Exception):
+    """Raised when every worker is busy and the waiting queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Redaction queue is full, try again later.")
+        self.retry_after = retry_after
+
+
+class RedactionExecutor:
+    """
+    Runs CPU-bound redaction work in a pool of worker processes so the event
+    loop stays responsive. At most `max_workers + max_queue` jobs are accepted
+    at once; anything beyond that is rejected with ExecutorBusy.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None,
+                 retry_after: int = None, name: str = "redaction"):
+        self.name = name
+        self.max_workers = max_workers or config.REDACTION_WORKERS
+        self.max_queue = config.REDACTION_QUEUE_SIZE if max_queue is None else max_queue
+        self.retry_after = retry_after or config.REDACTION_RETRY_AFTER
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        """Start a fresh pool next time, unless another caller already has."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in a worker process and await its result."""
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise ExecutorBusy(self.retry_after)
+            self._pending += 1
+
+        pool = self._get_pool()
+        try:
+            future = pool.submit(
+                _timed_call, functools.partial(fn, *args, **kwargs), time.time()
+            )
+        except BaseException as e:
+            self._release()
+            if isinstance(e, BrokenProcessPool):
+                # The pool broke before this job got in
+                self._discard(pool)
+            raise
+        # Release the slot when the worker is actually done, even if the caller
+        # stops waiting (e.g. the client disconnects)
+        future.add_done_callback(self._release)
+
+        try:
+            waited, result = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # A worker died (e.g. crashed on a malformed PDF); start a fresh pool next time
+            self._discard(pool)
+            raise
+        metrics.queue_wait.observe(max(0.0, waited), pool=self.name)
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+redaction_executor = RedactionExecutor()
+
+# Separate, smaller pool so page previews never wait behind long redactions
+preview_executor = RedactionExecutor(
+    config.PREVIEW_WORKERS, config.PREVIEW_QUEUE_SIZE, name="preview"
+)
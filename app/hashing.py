@@ -0,0 +1,35 @@
+import hashlib
+import os
+import threading
+
+_CHUNK_SIZE = 1024 * 1024
+
+# (path, size, mtime) -> hex digest, so unchanged files are only hashed once
+_memo = {}
+_memo_lock = threading.Lock()
+_MEMO_LIMIT = 4096
+
+
+def sha256_file(path: str) -> str:
+    """Return the SHA-256 hex digest of a file, memoized on its size and mtime."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _memo_lock:
+        digest = _memo.get(key)
+    if digest is not None:
+        return digest
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _memo_lock:
+        if len(_memo) >= _MEMO_LIMIT:
+            _memo.clear()
+        _memo[key] = digest
+    return digest
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+
+from app.executor import ExecutorBusy
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    params TEXT NOT NULL,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    pages_total INTEGER NOT NULL DEFAULT 0,
+    result_path TEXT,
+    error TEXT,
+    owner INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed job table. Every call opens its own short-lived connection,
+    so a store can be used from the event loop, threads and worker processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, params: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, state, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(params), now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> dict:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        return job
+
+    def claim(self) -> dict:
+        """Atomically move the oldest queued job to running and return it."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE state = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = ?, owner = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, os.getpid(), time.time(), row["id"]),
+            )
+            conn.execute("COMMIT")
+        return self.get(row["id"])
+
+    def set_progress(self, job_id: str, done: int, total: int):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET pages_done = ?, pages_total = ?, updated_at = ? WHERE id = ?",
+                (done, total, time.time(), job_id),
+            )
+
+    def finish(self, job_id: str, result_path: str):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, result_path = ?, pages_done = pages_total, "
+                "updated_at = ? WHERE id = ?",
+                (DONE, result_path, time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), job_id),
+            )
+
+    def requeue(self, job_id: str):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, updated_at = ? WHERE id = ?",
+                (QUEUED, time.time(), job_id),
+            )
+
+    def requeue_orphaned(self) -> int:
+        """Put running jobs whose owning process is gone back in the queue."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, owner FROM jobs WHERE state = ?", (RUNNING,)
+            ).fetchall()
+        orphaned = [row["id"] for row in rows if not _process_alive(row["owner"])]
+        for job_id in orphaned:
+            self.requeue(job_id)
+        return len(orphaned)
+
+
+def _process_alive(pid) -> bool:
+    if not pid or pid == os.getpid():
+        # Our own pid can only show up after a restart that reused it
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ProgressReporter:
+    """
+    Picklable progress callback handed to redact_text in the worker process.
+    Writes page progress to the job store, at most every `interval` seconds.
+    """
+
+    def __init__(self, db_path: str, job_id: str, interval: float = 0.5):
+        self.db_path = db_path
+        self.job_id = job_id
+        self.interval = interval
+        self._last = 0.0
+        self._store = None
+
+    def __call__(self, done: int, total: int):
+        now = time.monotonic()
+        if done < total and now - self._last < self.interval:
+            return
+        self._last = now
+        if self._store is None:
+            self._store = JobStore(self.db_path)
+        try:
+            self._store.set_progress(self.job_id, done, total)
+        except sqlite3.Error as e:
+            logger.warning("Failed to record progress for job %s: %s", self.job_id, e)
+
+
+class JobRunner:
+    """
+    Pulls queued jobs from the store and runs them with `handler`, an async
+    callable taking the job dict and returning the result path. Several
+    runners (or several server processes) can share one store safely.
+    """
+
+    def __init__(self, store: JobStore, handler, concurrency: int, poll_interval: float = 1.0):
+        self.store = store
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        self.store.requeue_orphaned()
+        self._tasks = [asyncio.create_task(self._loop()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle runners after a job was queued."""
+        self._wakeup.set()
+
+    async def _loop(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            try:
+                result_path = await self.handler(job)
+            except ExecutorBusy as e:
+                # No free worker right now: put the job back and try again later
+                await asyncio.to_thread(self.store.requeue, job["id"])
+                await asyncio.sleep(e.retry_after)
+            except asyncio.CancelledError:
+                # Shutting down: leave the job for the next start
+                await asyncio.to_thread(self.store.requeue, job["id"])
+                raise
+            except Exception as e:
+                await asyncio.to_thread(self.store.fail, job["id"], str(e))
+            else:
+                await asyncio.to_thread(self.store.finish, job["id"], result_path)
@@ -0,0 +1,170 @@
+import fitz  # PyMuPDF for working with PDFs
+from collections import deque
+from functools import lru_cache
+
+# Text extraction flags: like the rawdict defaults, but without image data
+TEXT_FLAGS = fitz.TEXTFLAGS_RAWDICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+def _fold(text: str) -> str:
+    """Lower-case text character by character so offsets stay aligned."""
+    folded = []
+    for c in text:
+        low = c.lower()
+        folded.append(low if len(low) == 1 else c)
+    return "".join(folded)
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Collapse inner whitespace and lower-case a keyword for matching."""
+    return _fold(" ".join(keyword.split()))
+
+
+class PageText:
+    """
+    The text of one page as a plain string, with the bounding box and line of
+    every character so that matches can be mapped back to rectangles.
+    """
+
+    def __init__(self, text: str, boxes: list, lines: list[int]):
+        self.text = text
+        self.boxes = boxes  # per character: (x0, y0, x1, y1) or None for separators
+        self.lines = lines  # per character: line number, -1 for separators
+
+    @classmethod
+    def from_page(cls, page, textpage=None) -> "PageText":
+        """Extract from the page itself, or from `textpage` (e.g. an OCR text page)."""
+        chars, boxes, lines = [], [], []
+        line_no = 0
+        raw = page.get_text("rawdict", flags=TEXT_FLAGS, textpage=textpage)
+        for block in raw["blocks"]:
+            if block.get("type") != 0:
+                continue
+            if chars:
+                # Blocks are separated by a newline so keywords never span them
+                chars.append("\n")
+                boxes.append(None)
+                lines.append(-1)
+            for n, line in enumerate(block["lines"]):
+                if n:
+                    # Lines of the same block are joined with a space so that
+                    # phrases wrapped onto the next line still match
+                    chars.append(" ")
+                    boxes.append(None)
+                    lines.append(-1)
+                for span in line["spans"]:
+                    for ch in span["chars"]:
+                        chars.append(ch["c"])
+                        boxes.append(tuple(ch["bbox"]))
+                        lines.append(line_no)
+                line_no += 1
+        return cls("".join(chars), boxes, lines)
+
+    def rects(self, start: int, end: int) -> list:
+        """Return one rectangle per line covered by the characters start..end."""
+        rects = {}
+        for k in range(start, end):
+            box = self.boxes[k]
+            if box is None:
+                continue
+            line = self.lines[k]
+            if line in rects:
+                rects[line] |= box
+            else:
+                rects[line] = fitz.Rect(box)
+        return [r for r in rects.values() if not r.is_empty]
+
+
+class KeywordMatcher:
+    """
+    Aho–Corasick automaton that finds every keyword in a text in a single
+    pass. Matching is case-insensitive; with `whole_words` a keyword only
+    matches when it is not part of a longer word.
+    """
+
+    def __init__(self, keywords: list[str], whole_words: bool = True):
+        self.keywords = []
+        self.whole_words = whole_words
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        seen = set()
+        for keyword in keywords:
+            pattern = normalize_keyword(keyword)
+            if not pattern or pattern in seen:
+                continue
+            seen.add(pattern)
+            self.keywords.append(keyword.strip())
+            self._add(pattern, len(self.keywords) - 1)
+        self._build()
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def _add(self, pattern: str, index: int):
+        state = 0
+        for c in pattern:
+            nxt = self._goto[state].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((index, len(pattern)))
+
+    def _build(self):
+        # Breadth-first pass to compute failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and c not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(c, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str):
+        """Yield (start, end, keyword index) for every match in text."""
+        folded = _fold(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for pos, c in enumerate(folded):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if not out[state]:
+                continue
+            end = pos + 1
+            for index, length in out[state]:
+                start = end - length
+                if self.whole_words and not self._on_word_boundary(folded, start, end):
+                    continue
+                yield start, end, index
+
+    @staticmethod
+    def _on_word_boundary(text: str, start: int, end: int) -> bool:
+        if text[start].isalnum() and start > 0 and text[start - 1].isalnum():
+            return False
+        if text[end - 1].isalnum() and end < len(text) and text[end].isalnum():
+            return False
+        return True
+
+
+@lru_cache(maxsize=128)
+def _compile(keywords: tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+
+def compile_keywords(keywords) -> KeywordMatcher:
+    """
+    KeywordMatcher for `keywords`, cached per process by the keyword list,
+    so repeated redactions with the same policy skip building the automaton.
+    The matcher is only read while matching, so sharing it is safe.
+    """
+    return _compile(tuple(keywords or ()))
@@ -0,0 +1,234 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A counter that is either incremented directly or read from `callback` at scrape time."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self._values = {}
+        self.callback = callback
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        if self.callback is not None:
+            items = [((), self.callback())]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    """A gauge that is either set directly or read from `callback` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), callback=None):
+        super().__init__(name, help, labels)
+        self._values = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> list[str]:
+        if self.callback is not None:
+            items = [((), self.callback())]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[n] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                le = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+            le = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=(), callback=None) -> Counter:
+        return self.register(Counter(name, help, labels, callback))
+
+    def gauge(self, name, help, labels=(), callback=None) -> Gauge:
+        return self.register(Gauge(name, help, labels, callback))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Collects wall-clock time per redaction stage, both summed for the whole
+    request and per page. Plain data only, so it can travel back from a
+    worker process with the result.
+    """
+
+    def __init__(self):
+        self.stages = {}  # stage -> total seconds
+        self.pages = {}   # page -> {stage: seconds}
+        self.counts = {}  # e.g. "matches" -> total
+
+    @contextmanager
+    def stage(self, name: str, page: int = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, page)
+
+    def add(self, name: str, seconds: float, page: int = None):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if page is not None:
+            per_page = self.pages.setdefault(page, {})
+            per_page[name] = per_page.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, other: "StageTimer"):
+        for name, n in other.counts.items():
+            self.count(name, n)
+        for name, seconds in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        for page, stages in other.pages.items():
+            per_page = self.pages.setdefault(page, {})
+            for name, seconds in stages.items():
+                per_page[name] = per_page.get(name, 0.0) + seconds
+
+    def slowest_pages(self, count: int = 5) -> list[dict]:
+        ranked = sorted(self.pages.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        return [
+            {"page": page, "seconds": sum(stages.values()), "stages": stages}
+            for page, stages in ranked[:count]
+        ]
+
+
+registry = Registry()
+
+# Size buckets in bytes for request and response bodies
+BYTE_BUCKETS = (10_000, 100_000, 1_000_000, 10_000_000, 100_000_000, 1_000_000_000)
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+queue_wait = registry.histogram(
+    "redaction_queue_wait_seconds", "Time jobs waited for a free worker process.", ("pool",))
+redaction_latency = registry.histogram(
+    "redaction_duration_seconds", "Wall-clock time of a redaction in the worker.")
+stage_seconds = registry.histogram(
+    "redaction_stage_seconds", "Time per redaction stage, per request.", ("stage",))
+page_stage_seconds = registry.histogram(
+    "redaction_page_stage_seconds", "Time per redaction stage, per page.", ("stage",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+pages_processed = registry.counter(
+    "redaction_pages_total", "Pages visited by redactions.")
+pages_modified = registry.counter(
+    "redaction_pages_modified_total", "Pages changed by redactions.")
+pages_per_second = registry.gauge(
+    "redaction_pages_per_second", "Throughput of the most recent redaction.")
+bytes_in = registry.counter(
+    "redaction_bytes_in_total", "Bytes of input PDFs redacted.")
+bytes_out = registry.counter(
+    "redaction_bytes_out_total", "Bytes of redacted PDFs written.")
+document_bytes = registry.histogram(
+    "redaction_document_bytes", "Size of input PDFs.", buckets=BYTE_BUCKETS)
+redaction_failures = registry.counter(
+    "redaction_failures_total", "Redactions that raised an error.")
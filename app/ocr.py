@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import fitz  # PyMuPDF for working with PDFs
+
+from app.matching import TEXT_FLAGS, PageText
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def tesseract_available() -> bool:
+    """Whether PyMuPDF can find Tesseract language data for OCR."""
+    try:
+        fitz.get_tessdata()
+    except Exception:
+        return False
+    return True
+
+
+def needs_ocr(page, text: PageText) -> bool:
+    """A page without a text layer that does show images, i.e. most likely a scan."""
+    return not text.text.strip() and bool(page.get_images())
+
+
+def _cache_path(cache_dir: str, digest: str, page: int, dpi: int, language: str) -> Path:
+    return Path(cache_dir) / digest[:2] / digest / f"{page}-{dpi}-{language}.json"
+
+
+def _load(path: Path) -> PageText:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    boxes = [tuple(b) if b is not None else None for b in data["boxes"]]
+    return PageText(data["text"], boxes, data["lines"])
+
+
+def _store(path: Path, text: PageText):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"text": text.text, "boxes": text.boxes, "lines": text.lines}, f)
+    os.replace(tmp, path)
+
+
+def ocr_page(input_path: str, page_number: int, dpi: int, language: str,
+             cache_dir: str = None, digest: str = None) -> PageText:
+    """
+    OCR one page with Tesseract and return its text in page coordinates.
+    The result is written to the OCR cache when `cache_dir` and `digest`
+    are given.
+    """
+    doc = fitz.open(input_path)
+    try:
+        page = doc[page_number]
+        textpage = page.get_textpage_ocr(flags=TEXT_FLAGS, language=language, dpi=dpi, full=True)
+        text = PageText.from_page(page, textpage=textpage)
+    finally:
+        doc.close()
+    if cache_dir and digest:
+        try:
+            _store(_cache_path(cache_dir, digest, page_number, dpi, language), text)
+        except OSError as e:
+            logger.warning("Failed to cache OCR text of page %d: %s", page_number, e)
+    return text
+
+
+def ocr_pages(input_path: str, pages: list[int], dpi: int, language: str,
+              cache_dir: str = None, digest: str = None, workers: int = 1) -> dict:
+    """
+    Return {page: PageText} for the given pages, from the OCR cache where
+    possible (keyed by file hash, page, dpi and language) and by OCR'ing the
+    rest, in parallel worker processes when `workers` > 1.
+    """
+    texts, missing = {}, []
+    for i in pages:
+        text = _load(_cache_path(cache_dir, digest, i, dpi, language)) if cache_dir and digest else None
+        if text is None:
+            missing.append(i)
+        else:
+            texts[i] = text
+
+    if len(missing) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            futures = {
+                i: pool.submit(ocr_page, input_path, i, dpi, language, cache_dir, digest)
+                for i in missing
+            }
+            for i, future in futures.items():
+                texts[i] = future.result()
+    else:
+        for i in missing:
+            texts[i] = ocr_page(input_path, i, dpi, language, cache_dir, digest)
+    return texts
@@ -0,0 +1,99 @@
+import re
+from functools import lru_cache
+
+
+def _luhn_valid(value: str) -> bool:
+    """Luhn checksum used by payment card numbers."""
+    digits = [int(c) for c in value if c.isdigit()]
+    if not 13 <= len(digits) <= 19:
+        return False
+    total = 0
+    for n, d in enumerate(reversed(digits)):
+        if n % 2 == 1:
+            d *= 2
+            if d > 9:
+                d -= 9
+        total += d
+    return total % 10 == 0
+
+
+def _iban_valid(value: str) -> bool:
+    """ISO 13616 mod-97 check for IBANs."""
+    iban = "".join(value.split()).upper()
+    if not 15 <= len(iban) <= 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    try:
+        number = int("".join(str(int(c, 36)) for c in rearranged))
+    except ValueError:
+        return False
+    return number % 97 == 1
+
+
+# Built-in pattern classes: name -> (regex, flags, optional validator)
+BUILTIN_PATTERNS = {
+    "ssn": (r"(?<!\d)(?!000|666|9\d\d)\d{3}-(?!00)\d{2}-(?!0000)\d{4}(?!\d)", 0, None),
+    "email": (r"(?<![\w.+-])[\w.%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}(?![\w-])", 0, None),
+    "phone": (r"(?<![\w+])(?:\+?1[ .-]?)?(?:\(\d{3}\)|\d{3})[ .-]?\d{3}[ .-]?\d{4}(?!\w)", 0, None),
+    "iban": (r"(?<![A-Za-z0-9])[A-Za-z]{2}\d{2}(?: ?[A-Za-z0-9]{4}){2,7}(?: ?[A-Za-z0-9]{1,4})?(?![A-Za-z0-9])", 0, _iban_valid),
+    "credit_card": (r"(?<![\d-])\d(?:[ -]?\d){12,18}(?![\d-])", 0, _luhn_valid),
+}
+
+
+class PatternSet:
+    """A compiled set of named regular expressions matched against page text."""
+
+    def __init__(self, entries: list[tuple]):
+        self.entries = entries  # (name, compiled regex, validator or None)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    @property
+    def names(self) -> list[str]:
+        return [name for name, _, _ in self.entries]
+
+    def find(self, text: str):
+        """Yield (start, end, pattern index) for every validated match in text."""
+        for index, (_, regex, validator) in enumerate(self.entries):
+            for m in regex.finditer(text):
+                if m.start() == m.end():
+                    continue
+                if validator is not None and not validator(m.group()):
+                    continue
+                yield m.start(), m.end(), index
+
+
+def normalize_patterns(patterns) -> tuple[str, ...]:
+    """Drop empty entries and duplicates, and give the set a stable order."""
+    cleaned = set()
+    for p in patterns or ():
+        p = p.strip()
+        if not p:
+            continue
+        cleaned.add(p.lower() if p.lower() in BUILTIN_PATTERNS else p)
+    return tuple(sorted(cleaned))
+
+
+@lru_cache(maxsize=128)
+def _compile(patterns: tuple[str, ...]) -> PatternSet:
+    entries = []
+    for p in patterns:
+        if p in BUILTIN_PATTERNS:
+            regex, flags, validator = BUILTIN_PATTERNS[p]
+            entries.append((p, re.compile(regex, flags), validator))
+        else:
+            try:
+                entries.append((p, re.compile(p), None))
+            except re.error as e:
+                raise ValueError(f"Invalid pattern '{p}': {e}")
+    return PatternSet(entries)
+
+
+def compile_patterns(patterns) -> PatternSet:
+    """
+    Compile built-in pattern names (e.g. "ssn", "email") and custom regexes.
+    Compiled sets are cached by their normalized pattern set, so repeated
+    requests with the same policy skip compilation.
+    """
+    return _compile(normalize_patterns(patterns))
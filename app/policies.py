@@ -0,0 +1,195 @@
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+
+from app import config
+from app.ocr import tesseract_available
+from app.patterns import compile_patterns, normalize_patterns
+from app.redaction import DEFAULT_FILL, DEFAULT_PLACEHOLDER, IMAGE_MODES, SAVE_PRESETS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS policies (
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (name, version)
+);
+"""
+
+
+class PolicyStore:
+    """
+    SQLite-backed table of named redaction policies. Saving a policy under an
+    existing name adds a new version; versions are never changed, so a
+    (name, version) pair can be cached forever.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create(self, name: str, body: dict) -> int:
+        """Store `body` as the next version of policy `name` and return that version."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            (latest,) = conn.execute(
+                "SELECT MAX(version) FROM policies WHERE name = ?", (name,)
+            ).fetchone()
+            version = (latest or 0) + 1
+            conn.execute(
+                "INSERT INTO policies (name, version, body, created_at) VALUES (?, ?, ?, ?)",
+                (name, version, json.dumps(body), time.time()),
+            )
+            conn.execute("COMMIT")
+        return version
+
+    def latest_version(self, name: str) -> int:
+        with closing(self._connect()) as conn:
+            (version,) = conn.execute(
+                "SELECT MAX(version) FROM policies WHERE name = ?", (name,)
+            ).fetchone()
+        return version
+
+    def get(self, name: str, version: int = None) -> dict:
+        """The given version of a policy (the latest if None), or None."""
+        with closing(self._connect()) as conn:
+            if version is None:
+                row = conn.execute(
+                    "SELECT * FROM policies WHERE name = ? ORDER BY version DESC LIMIT 1", (name,)
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT * FROM policies WHERE name = ? AND version = ?", (name, version)
+                ).fetchone()
+        if row is None:
+            return None
+        policy = dict(row)
+        policy["body"] = json.loads(policy["body"])
+        return policy
+
+    def versions(self, name: str) -> list[int]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT version FROM policies WHERE name = ? ORDER BY version", (name,)
+            ).fetchall()
+        return [row["version"] for row in rows]
+
+
+def compile_policy(body: dict) -> dict:
+    """
+    Check the rules of a policy (the fields of POST /policies, missing ones
+    taking their defaults) and turn them into redact_text keyword arguments.
+    Raises ValueError with a message fit for the client on bad input.
+    """
+    # Validate and parse keywords: a comma-separated string (or a list)
+    keywords = body.get("keywords") or []
+    if isinstance(keywords, str):
+        keywords = keywords.split(",")
+    if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
+        raise ValueError("Keywords must be a comma-separated string.")
+    keywords = [k.strip() for k in keywords if k.strip()]
+
+    # Validate patterns; compiling here also catches bad regexes before queuing
+    patterns = body.get("patterns") or []
+    compile_patterns(patterns)
+
+    # Parse page range (e.g., "1-3,5")
+    try:
+        pages = parse_page_range(body.get("page_range"))
+    except ValueError as e:
+        raise ValueError(f"Invalid page range: {str(e)}")
+
+    save_mode = body.get("save_mode") or "balanced"
+    if save_mode not in SAVE_PRESETS:
+        raise ValueError(f"save_mode must be one of: {', '.join(SAVE_PRESETS)}.")
+
+    image_mode = body.get("image_mode") or "all"
+    if image_mode not in IMAGE_MODES:
+        raise ValueError(f"image_mode must be one of: {', '.join(IMAGE_MODES)}.")
+    image_min_size = body.get("image_min_size") or 0
+    if image_min_size < 0:
+        raise ValueError("image_min_size must not be negative.")
+    image_hashes = sorted({h.strip().lower() for h in body.get("image_hashes") or [] if h.strip()})
+    if not all(re.fullmatch(r"[0-9a-f]{32}", h) for h in image_hashes):
+        raise ValueError("image_hashes must be MD5 hex digests.")
+
+    ocr_dpi = body.get("ocr_dpi") or config.OCR_DPI
+    ocr_language = body.get("ocr_language") or "eng"
+    if body.get("ocr"):
+        if not tesseract_available():
+            raise ValueError("OCR is not available: Tesseract is not installed.")
+        if not 72 <= ocr_dpi <= 600:
+            raise ValueError("ocr_dpi must be between 72 and 600.")
+        if not re.fullmatch(r"[A-Za-z_]+(\+[A-Za-z_]+)*", ocr_language):
+            raise ValueError("ocr_language must be Tesseract language codes, e.g. 'eng' or 'eng+deu'.")
+
+    placeholder = body.get("placeholder")
+    if placeholder is None:
+        placeholder = DEFAULT_PLACEHOLDER
+    if len(placeholder) > 200:
+        raise ValueError("placeholder must be at most 200 characters.")
+    fill = list(DEFAULT_FILL)
+    if body.get("fill"):
+        if not re.fullmatch(r"#?[0-9a-fA-F]{6}", body["fill"]):
+            raise ValueError("fill must be a hex color like '#000000'.")
+        rgb = body["fill"].lstrip("#")
+        fill = [round(int(rgb[n:n + 2], 16) / 255, 4) for n in (0, 2, 4)]
+
+    return {
+        "keywords": keywords,
+        "pages": pages,
+        "remove_images": bool(body.get("remove_graphics")),
+        "image_mode": image_mode,
+        "image_min_size": image_min_size,
+        "image_hashes": image_hashes,
+        "patterns": list(normalize_patterns(patterns)),
+        "save_mode": save_mode,
+        "linearize": bool(body.get("linearize")),
+        "ocr": bool(body.get("ocr")),
+        "ocr_dpi": ocr_dpi,
+        "ocr_language": ocr_language,
+        "placeholder": placeholder,
+        "fill": fill,
+    }
+
+
+def parse_page_range(range_str: str) -> list[int]:
+    """Parse a page range like "1-3,5" into [0, 1, 2, 4] (0-indexed)."""
+    if not range_str:
+        return []
+
+    pages = set()
+    parts = range_str.split(',')
+
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            try:
+                start, end = map(int, part.split('-'))
+                if start > end:
+                    raise ValueError("Start of range cannot be greater than end.")
+                pages.update(range(start - 1, end))  # 0-indexed
+            except:
+                raise ValueError(f"Invalid range segment: '{part}'")
+        else:
+            try:
+                pages.add(int(part) - 1)
+            except:
+                raise ValueError(f"Invalid page number: '{part}'")
+
+    return sorted(pages)
@@ -0,0 +1,157 @@
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+
+import fitz  # PyMuPDF for working with PDFs
+
+from app.doccache import open_document
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it WebP is unavailable
+    Image = None
+
+# Output formats: name -> media type
+FORMATS = {"png": "image/png", "jpeg": "image/jpeg"}
+if Image is not None:
+    FORMATS["webp"] = "image/webp"
+
+
+def document_info(path: str, digest: str) -> dict:
+    """Page count and page sizes (in points) of a PDF with the given content hash."""
+    with open_document(path, digest) as doc:
+        return {
+            "page_count": len(doc),
+            "page_sizes": [[page.rect.width, page.rect.height] for page in doc],
+        }
+
+
+def render_page(path: str, digest: str, page_number: int, dpi: int, width: int,
+                fmt: str) -> bytes:
+    """
+    Render one page to an image. With `width` the page is scaled to exactly
+    that many pixels wide; otherwise it is rendered at `dpi`. The parsed
+    document is reused across calls for the same content hash.
+    """
+    with open_document(path, digest) as doc:
+        if not 0 <= page_number < len(doc):
+            raise IndexError(f"Page {page_number} out of range (document has {len(doc)} pages)")
+        page = doc[page_number]
+        zoom = width / page.rect.width if width else dpi / 72
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        if fmt == "webp":
+            img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+            buf = BytesIO()
+            img.save(buf, format="WEBP", quality=80)
+            return buf.getvalue()
+        return pix.tobytes("jpeg" if fmt == "jpeg" else "png")
+
+
+class PreviewCache:
+    """
+    Two-level cache of rendered pages: an in-memory LRU bounded by bytes in
+    front of a directory on disk. Keys are (file hash, page, dpi, width, format),
+    so a re-uploaded file with new content never hits stale renders. Once the
+    directory grows past `disk_bytes`, the least recently used renders are
+    deleted until it is back under 90% of that; 0 keeps renders in memory only.
+    """
+
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int = 0):
+        self.directory = Path(directory)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._size = 0
+        self._disk_size = None  # measured on first write, then kept up to date
+        self._lock = threading.Lock()
+
+    def _path(self, key: tuple) -> Path:
+        digest, page, dpi, width, fmt = key
+        return self.directory / digest[:2] / digest / f"{page}-{dpi}-{width}.{fmt}"
+
+    def get(self, key: tuple) -> bytes:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+        if not self.disk_bytes:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Touch the render so eviction sees it as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def put(self, key: tuple, data: bytes):
+        if self.disk_bytes:
+            path = self._path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            with self._lock:
+                if self._disk_size is not None:
+                    self._disk_size += len(data)
+                full = self._disk_size is None or self._disk_size > self.disk_bytes
+            if full:
+                self.evict()
+        self._remember(key, data)
+
+    def evict(self):
+        """Delete least recently used renders on disk until they fit in the quota."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        # Stop well under the quota, so the next few renders don't walk the tree again
+        target = self.disk_bytes * 9 // 10 if total > self.disk_bytes else self.disk_bytes
+        entries.sort()
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+            try:
+                # The document's directory, once its last render is gone
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_size = total
+            self.evictions += evicted
+
+    def _remember(self, key: tuple, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._memory[key] = data
+            self._size += len(data)
+            while self._size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._size -= len(evicted)
@@ -1,82 +1,915 @@
+import contextlib
 import fitz  # PyMuPDF for working with PDFs
+import logging
 import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from app.doccache import open_document, page_text
+from app.matching import KeywordMatcher, PageText, compile_keywords
+from app.metrics import StageTimer
+from app.ocr import needs_ocr, ocr_pages
+from app.patterns import PatternSet, compile_patterns, normalize_patterns
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a change to the engine alters its output, so cached results are not reused
+ENGINE_VERSION = "2"
+
+# Save strategies: garbage collection level and stream compression
+SAVE_PRESETS = {
+    # Drop unused objects only; quickest save, largest files
+    "fast": {"garbage": 1, "deflate": False},
+    # Also compress uncompressed streams such as rewritten page contents
+    "balanced": {"garbage": 1, "deflate": True},
+    # Merge duplicate objects and compress everything; slowest, smallest files
+    "compact": {"garbage": 4, "deflate": True, "deflate_images": True,
+                "deflate_fonts": True, "use_objstms": 1},
+}
+
+
+# What a redacted area looks like unless the request says otherwise
+DEFAULT_PLACEHOLDER = "[---REDACTED---]"
+DEFAULT_FILL = (1, 1, 0)
+
+# Page entries a redaction rewrites, carried from page-parallel workers
+_PAGE_KEYS = ("Contents", "Resources", "Annots")
+_REFERENCE = re.compile(r"\b(\d+) 0 R\b")
+
+# How remove_images treats a page's images
+IMAGE_MODES = ("all", "overlap", "pixelate")
+
+
+class ImagePolicy:
+    """
+    Which images a redaction removes or pixelates:
+
+    - mode "all": every image on the page (and so on every other page
+      sharing it, see below); "overlap": only images that
+      intersect a redaction area on the page; "pixelate": like overlap, but
+      the image is replaced by a coarse version instead of removed. None
+      leaves images alone except for `hashes`.
+    - images smaller than `min_size` points in either direction are ignored
+      by the mode (icons, bullets);
+    - images whose MD5 digest (hex) is in `hashes` are always removed, e.g.
+      a known logo.
+
+    An image is one object (xref) however many pages show it. Removals by
+    "all" and by hash act on that object, once per document: the image goes
+    from every page that shows it, including pages outside the selected
+    range. "overlap" and "pixelate" depend on one page's redactions, so they
+    only change that page's placement of the image.
+    """
+
+    def __init__(self, mode: str = "all", min_size: float = 0, hashes=()):
+        if mode is not None and mode not in IMAGE_MODES:
+            raise ValueError(f"Unknown image mode '{mode}', expected one of {IMAGE_MODES}")
+        self.mode = mode
+        self.min_size = min_size or 0
+        self.hashes = {h.lower() for h in hashes or ()}
+        self.done = set()  # xrefs already processed in this document
+
+    def __bool__(self):
+        return self.mode is not None or bool(self.hashes)
+
+    def select(self, page) -> list[tuple[int, str]]:
+        """
+        The (xref, action) pairs to carry out on this page: "remove" the image
+        from the document, or "erase" or "pixelate" it on this page only.
+        """
+        infos = {}
+        if self.hashes or self.min_size or self.mode != "all":
+            for info in page.get_image_info(hashes=bool(self.hashes), xrefs=True):
+                if info["xref"]:
+                    infos.setdefault(info["xref"], []).append(info)
+        areas = None
+
+        targets = []
+        for img in page.get_images(full=True):
+            xref = img[0]
+            placements = infos.get(xref, [])
+            if self.hashes and any(p["digest"].hex() in self.hashes for p in placements):
+                targets.append((xref, "remove"))
+                continue
+            if self.mode is None:
+                continue
+            rects = [fitz.Rect(p["bbox"]) for p in placements]
+            if self.min_size and rects and all(
+                r.width < self.min_size or r.height < self.min_size for r in rects
+            ):
+                continue
+            if self.mode == "all":
+                targets.append((xref, "remove"))
+                continue
+            if areas is None:
+                areas = [a.rect for a in page.annots(types=[fitz.PDF_ANNOT_REDACT])]
+            if any(r.intersects(a) for r in rects for a in areas):
+                targets.append((xref, "erase" if self.mode == "overlap" else "pixelate"))
+        return targets
+
+
+def _pixelate_image(page, xref: int):
+    """
+    Replace an image with a copy shrunk to at most 32 pixels a side, which
+    renders blocky. Images that small already are left as they are.
+    """
+    pix = fitz.Pixmap(page.parent, xref)
+    shrink = 0
+    while max(pix.width, pix.height) >> shrink > 32:
+        shrink += 1
+    if not shrink:
+        # (replacing it with an identical pixmap would blank the placement)
+        return
+    if pix.n - pix.alpha > 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    pix.shrink(shrink)
+    page.replace_image(xref, pixmap=pix)
+
+
+def _image_bboxes(page) -> dict[int, list]:
+    """Rounded bboxes of the images on a page by xref, read from the page as it is now."""
+    # (get_image_info caches its result per page, so it misses applied redactions)
+    bboxes = {}
+    for item in page.get_images(full=True):
+        bbox = page.get_image_bbox(item)
+        bboxes.setdefault(item[0], []).append(tuple(round(v, 2) for v in bbox))
+    return bboxes
+
+
+def _change_placements(page, targets: list[tuple[int, str]], placements: dict[int, list]):
+    """
+    Erase or pixelate this page's placements of images after its redactions
+    are applied. `placements` maps every image xref on the page beforehand
+    to its rounded bboxes. Applying a redaction over an image gives the page
+    its own copy of it, found again here by position, so changing the copy
+    leaves other pages that show the same image alone.
+    """
+    copies = {}
+    for xref, bboxes in _image_bboxes(page).items():
+        for bbox in bboxes:
+            copies.setdefault(bbox, set()).add(xref)
+    changed = set()
+    for xref, action in targets:
+        for bbox in placements.get(xref, []):
+            for copy in copies.get(bbox, ()):
+                # Images the page had before are shared, or not the one wanted
+                if copy in placements or copy in changed:
+                    continue
+                changed.add(copy)
+                if action == "pixelate":
+                    _pixelate_image(page, copy)
+                else:
+                    page.delete_image(copy)
+
+
+def _index_boxes(manual_boxes: list[dict]) -> dict[int, list]:
+    """Group manual boxes by page as rectangles, dropping malformed ones."""
+    boxes_by_page = {}
+    for box in manual_boxes or []:
+        try:
+            # Validate and create rectangle
+            page = box["page"]
+            rect = fitz.Rect(
+                max(0, box["x0"]),
+                max(0, box["y0"]),
+                max(0, box["x1"]),
+                max(0, box["y1"]),
+            )
+        except Exception as e:
+            logger.warning("Invalid box format %r: %s", box, e)
+            continue
+        boxes_by_page.setdefault(page, []).append(rect)
+    return boxes_by_page
+
+
+def _write_thumbnail(page, path: str, dpi: int):
+    """Render a page (without its annotations) to a PNG file."""
+    try:
+        page.get_pixmap(dpi=dpi, annots=False).save(path)
+    except Exception as e:
+        logger.warning("Failed to render %s: %s", path, e)
+
+
+def _redact_page(page, i: int, matcher: KeywordMatcher, patterns: PatternSet,
+                 placeholder: str, images: ImagePolicy, boxes: list,
+                 timer: StageTimer, diff_dir: str = None, diff_dpi: int = 40,
+                 input_hash: str = None, ocr_text: PageText = None,
+                 fill: tuple = DEFAULT_FILL, errors: list = None) -> bool:
+    """
+    Marks keywords, pattern matches and the page's manual boxes on a single
+    page (filled with `fill`, an RGB tuple, and labelled `placeholder`),
+    removes or pixelates images as `images` says (None leaves them), and
+    applies the redactions.
+    Returns whether the page was changed; untouched pages are left alone.
+    Time spent in each stage is recorded on `timer`.
+
+    With `diff_dir`, a changed page is rendered to "<i>-before.png" and
+    "<i>-after.png" in that directory, from the document already open.
+    With `input_hash`, the page text is reused from earlier redactions of
+    the same content in this process. `ocr_text` replaces the page's own
+    text, for scanned pages. A page whose text couldn't be searched is
+    logged and, if given, appended to `errors`.
+    """
+    images_changed = False
+
+    # Extract the page text once and run keywords and patterns over it
+    if matcher or patterns:
+        try:
+            with timer.stage("extract", i):
+                text = ocr_text if ocr_text is not None else page_text(page, input_hash, i)
+            with timer.stage("search", i):
+                spans = []
+                if matcher:
+                    spans.extend(matcher.find(text.text))
+                if patterns:
+                    spans.extend(patterns.find(text.text))
+            timer.count("matches", len(spans))
+            with timer.stage("annotate", i):
+                for start, end, _ in spans:
+                    for rect in text.rects(start, end):
+                        page.add_redact_annot(rect, fill=fill, text=placeholder)
+        except Exception as e:
+            logger.warning("Error searching keywords and patterns on page %d: %s", i, e)
+            if errors is not None:
+                errors.append(i)
+
+    # Handle manual redaction boxes, if provided
+    with timer.stage("annotate", i):
+        for rect in boxes:
+            try:
+                page.add_redact_annot(rect, fill=fill, text=placeholder)
+            except Exception as e:
+                logger.warning("Invalid box %s on page %d: %s", rect, i, e)
+
+    # Redactions made above (plus any the input already carried)
+    redacted = next(page.annots(types=[fitz.PDF_ANNOT_REDACT]), None) is not None
+    targets = []
+    if images:
+        with timer.stage("images", i):
+            try:
+                targets = images.select(page)
+            except Exception as e:
+                logger.warning("Failed to list images on page %d: %s", i, e)
+
+    # Snapshot the page before anything is removed from it
+    if diff_dir and (redacted or targets):
+        with timer.stage("diff", i):
+            _write_thumbnail(page, os.path.join(diff_dir, f"{i}-before.png"), diff_dpi)
+
+    # Remove the chosen images; ones shared with a page seen earlier were
+    # already removed there. Erasing and pixelating wait for the redactions.
+    placed, placements = [], {}
+    if targets:
+        with timer.stage("images", i):
+            for xref, action in targets:
+                images_changed = True
+                if action != "remove":
+                    placed.append((xref, action))
+                    continue
+                if redacted:
+                    # A redaction over the empty image left behind would
+                    # give the page an opaque copy of it, erased after apply
+                    placed.append((xref, "erase"))
+                if xref in images.done:
+                    continue
+                images.done.add(xref)
+                try:
+                    page.delete_image(xref)
+                except Exception as e:
+                    logger.warning("Failed to remove image %d on page %d: %s", xref, i, e)
+            if placed:
+                placements = _image_bboxes(page)
+
+    # Finally, apply the redactions, skipping the expensive rewrite on pages without any
+    if redacted:
+        with timer.stage("apply", i):
+            try:
+                page.apply_redactions()
+            except Exception as e:
+                logger.warning("Failed to apply redactions on page %d: %s", i, e)
+    if placed:
+        with timer.stage("images", i):
+            try:
+                _change_placements(page, placed, placements)
+            except Exception as e:
+                logger.warning("Failed to change images on page %d: %s", i, e)
+
+    if diff_dir and (redacted or targets):
+        with timer.stage("diff", i):
+            _write_thumbnail(page, os.path.join(diff_dir, f"{i}-after.png"), diff_dpi)
+    return redacted or images_changed
+
+
+def _redact_chunk(input_path: str, chunk: list[int], matcher: KeywordMatcher,
+                  patterns: tuple[str, ...], placeholder: str, images: ImagePolicy,
+                  boxes_by_page: dict[int, list], diff_dir: str = None,
+                  diff_dpi: int = 40, ocr_texts: dict = None,
+                  fill: tuple = DEFAULT_FILL) -> tuple:
+    """
+    Worker for the page-parallel mode: redacts the given pages with its own
+    document handle. Returns the modified pages, their changes as exported
+    by _export_pages (None if there are none), the chunk's stage timings and
+    the pages whose search failed.
+    """
+    timer = StageTimer()
+    errors = []
+    compiled = compile_patterns(patterns)
+    with timer.stage("open"):
+        doc = fitz.open(input_path)
+    try:
+        base = doc.xref_length()
+        modified = [
+            i for i in chunk
+            if _redact_page(doc[i], i, matcher, compiled, placeholder, images,
+                            boxes_by_page.get(i, []), timer, diff_dir, diff_dpi,
+                            ocr_text=(ocr_texts or {}).get(i), fill=fill, errors=errors)
+        ]
+        if not modified:
+            return modified, None, timer, errors
+        with timer.stage("export"):
+            changes = _export_pages(doc, modified, base)
+        # Removed images are shared objects: the parent removes them once for all pages
+        changes["removed_images"] = sorted(x for x in (images.done if images else ()) if x < base)
+        return modified, changes, timer, errors
+    finally:
+        doc.close()
+
+
+def _export_pages(doc, pages: list[int], base: int) -> dict:
+    """
+    The changes redaction made to `pages` of a document opened from the
+    input file, to be replayed on another handle of the same file: every
+    object created since the xref table had `base` entries, and the page
+    entries that point into them. Objects of the input keep their numbers
+    in both handles, so references to them carry over as they are.
+    """
+    objects = {}
+    for xref in range(base, doc.xref_length()):
+        text = doc.xref_object(xref, compressed=True)
+        if text == "null":
+            continue
+        raw = doc.xref_stream_raw(xref) if doc.xref_is_stream(xref) else None
+        objects[xref] = (text, raw)
+
+    entries = {}
+    for i in pages:
+        page_xref = doc[i].xref
+        values = {}
+        for key in _PAGE_KEYS:
+            kind, value = doc.xref_get_key(page_xref, key)
+            if kind == "xref" and key != "Contents":
+                ref = int(value.split()[0])
+                if ref < base:
+                    # An object of the input that redaction may have changed in place
+                    value = doc.xref_object(ref, compressed=True)
+            values[key] = value
+        entries[i] = values
+    return {"objects": objects, "pages": entries}
+
+
+def _import_pages(doc, changes: dict):
+    """Replay the changes exported by _export_pages onto `doc`."""
+    renumber = {xref: doc.get_new_xref() for xref in changes["objects"]}
+
+    def remap(text: str) -> str:
+        return _REFERENCE.sub(lambda m: f"{renumber.get(int(m.group(1)), int(m.group(1)))} 0 R", text)
+
+    for xref, (text, raw) in changes["objects"].items():
+        new = renumber[xref]
+        doc.update_object(new, remap(text))
+        if raw is not None:
+            # Store the stream as it was encoded; writing it drops the
+            # filter entries, so they are put back afterwards
+            kept = [(key, doc.xref_get_key(new, key)) for key in ("Filter", "DecodeParms")]
+            doc.update_stream(new, raw, new=True, compress=False)
+            for key, (kind, value) in kept:
+                if kind != "null":
+                    doc.xref_set_key(new, key, value)
+
+    for i, values in changes["pages"].items():
+        page_xref = doc.page_xref(i)
+        for key, value in values.items():
+            doc.xref_set_key(page_xref, key, remap(value))
+
+
+def _split_chunks(pages: list[int], count: int) -> list[list[int]]:
+    """Split a sorted page list into `count` contiguous, similarly sized chunks."""
+    size, extra = divmod(len(pages), count)
+    chunks, start = [], 0
+    for n in range(count):
+        end = start + size + (1 if n < extra else 0)
+        if end > start:
+            chunks.append(pages[start:end])
+        start = end
+    return chunks
+
+
+def _redact_parallel(doc, input_path: str, selected: list[int], matcher: KeywordMatcher,
+                     patterns: tuple[str, ...], placeholder: str, images: ImagePolicy,
+                     boxes_by_page: dict[int, list], page_workers: int, progress,
+                     timer: StageTimer, diff_dir: str = None, diff_dpi: int = 40,
+                     ocr_texts: dict = None, fill: tuple = DEFAULT_FILL, errors: list = None):
+    """
+    Redacts the selected pages in chunks across worker processes and swaps
+    the modified pages into `doc`. Progress is reported as each chunk
+    completes, and the workers' stage timings are merged into `timer`.
+    Pages whose search failed are appended to `errors`. Returns the sorted
+    list of modified pages.
+    """
+    chunks = _split_chunks(selected, page_workers)
+    results = [None] * len(chunks)
+    done = 0
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        futures = {
+            pool.submit(_redact_chunk, input_path, chunk, matcher, patterns,
+                        placeholder, images,
+                        # Only ship each worker the boxes of its own pages
+                        {i: boxes_by_page[i] for i in chunk if i in boxes_by_page},
+                        diff_dir, diff_dpi,
+                        {i: ocr_texts[i] for i in chunk if i in (ocr_texts or {})},
+                        fill): n
+            for n, chunk in enumerate(chunks)
+        }
+        for future in as_completed(futures):
+            n = futures[future]
+            results[n] = future.result()
+            done += len(chunks[n])
+            if progress:
+                progress(done, len(selected))
+
+    for _, _, chunk_timer, chunk_errors in results:
+        timer.merge(chunk_timer)
+        if errors is not None:
+            errors.extend(chunk_errors)
+    modified = sorted(i for chunk_modified, _, _, _ in results for i in chunk_modified)
+    if modified:
+        with timer.stage("stitch"):
+            _swap_in_pages(doc, [changes for _, changes, _, _ in results if changes is not None])
+    return modified
+
+
+def _swap_in_pages(doc, chunks: list[dict]):
+    """
+    Give the pages redacted by the workers their new content, annotations
+    and resources, in `doc` itself. The original page objects stay, so
+    outlines, links pointing at them, page labels, form fields, embedded
+    files and XMP metadata are kept as in a serial redaction. Images a
+    worker removed are removed here once, from the whole document, as the
+    serial path does.
+    """
+    removed = sorted({xref for changes in chunks for xref in changes["removed_images"]})
+    if removed:
+        # Removing an image leaves an empty stream on the page used for it,
+        # and that page's contents are replaced right after
+        page = doc[min(i for changes in chunks for i in changes["pages"])]
+        for xref in removed:
+            try:
+                page.delete_image(xref)
+            except Exception as e:
+                logger.warning("Failed to remove image %d: %s", xref, e)
+    for changes in chunks:
+        _import_pages(doc, changes)
+
+
+def _save(doc, output_path: str, save_mode: str, linearize: bool) -> dict:
+    """Save with the chosen preset and return the options actually used."""
+    options = dict(SAVE_PRESETS[save_mode])
+    if linearize:
+        # Object streams can't be combined with linearization
+        linear_options = {k: v for k, v in options.items() if k != "use_objstms"}
+        try:
+            doc.save(output_path, linear=True, **linear_options)
+            linear_options["linear"] = True
+            return linear_options
+        except Exception as e:
+            # Newer MuPDF builds dropped linearization; fall back to a normal save
+            logger.info("Linearized save not available, saving normally: %s", e)
+    doc.save(output_path, **options)
+    options["linear"] = False
+    return options
+
+
+def _reset_dir(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def render_diff(input_path: str, output_path: str, pages: list[int], diff_dir: str,
+                diff_dpi: int = 40):
+    """
+    Render the before/after thumbnails of `pages` from an existing input and
+    redacted output, for results that did not come from a redaction pass
+    (e.g. result cache hits). Writes the same files as redact_text.
+    """
+    _reset_dir(diff_dir)
+    before, after = fitz.open(input_path), fitz.open(output_path)
+    try:
+        for i in pages:
+            _write_thumbnail(before[i], os.path.join(diff_dir, f"{i}-before.png"), diff_dpi)
+            _write_thumbnail(after[i], os.path.join(diff_dir, f"{i}-after.png"), diff_dpi)
+    finally:
+        before.close()
+        after.close()
+
+
+def _ocr_scanned_pages(doc, input_path: str, selected: list[int], input_hash: str,
+                       dpi: int, language: str, cache_dir: str, workers: int) -> dict:
+    """OCR text ({page: PageText}) for the selected pages that have no text layer."""
+    scanned = [i for i in selected if needs_ocr(doc[i], page_text(doc[i], input_hash, i))]
+    if not scanned:
+        return {}
+    return ocr_pages(input_path, scanned, dpi, language, cache_dir, input_hash, workers)
+
+
+def _count_matches(text: str, matcher: KeywordMatcher, patterns: PatternSet) -> int:
+    count = sum(1 for _ in matcher.find(text)) if matcher else 0
+    if patterns:
+        count += sum(1 for _ in patterns.find(text))
+    return count
+
+
+def verify_redaction(doc, selected: list[int], matcher: KeywordMatcher,
+                     patterns: PatternSet, unsearched: list[int] = ()) -> dict:
+    """
+    Look for text the policy should have removed in an already redacted,
+    still open document: the text layer of every selected page,
+    annotations and form fields on those pages, and the document metadata,
+    XMP and outline. `unsearched` pages (whose search failed during
+    redaction) are checked like the others. Page text is extracted apart
+    from the redaction's PageText, as plain text with all whitespace
+    collapsed to single spaces, so matches the redaction could not see
+    (e.g. a phrase split across text blocks) are reported too. Text that
+    only exists in images (scans) can't be checked this way.
+
+    Returns {"passed", "pages": [{"page", "passed", "matches"}] per selected
+    page (with "error" and no matches if it can't be read), "annotations":
+    [{"page", "matches"}] for pages whose annotations still match,
+    "metadata": {"passed", "fields"}} naming the leaking fields.
+    """
+    pages = []
+    for i in sorted(set(selected) | set(unsearched)):
+        try:
+            text = " ".join(doc[i].get_text("text").split())
+            n = _count_matches(text, matcher, patterns)
+        except Exception as e:
+            pages.append({"page": i, "passed": False, "matches": None, "error": str(e)})
+            continue
+        pages.append({"page": i, "passed": n == 0, "matches": n})
+
+    annotations = []
+    for i in selected:
+        page = doc[i]
+        texts = [
+            value
+            for annot in page.annots()
+            for value in (annot.info.get("content"), annot.info.get("title"), annot.info.get("subject"))
+            if value
+        ]
+        texts.extend(w.field_value for w in page.widgets() if isinstance(w.field_value, str))
+        n = _count_matches("\n".join(texts), matcher, patterns) if texts else 0
+        if n:
+            annotations.append({"page": i, "matches": n})
+
+    fields = {k: v for k, v in (doc.metadata or {}).items() if isinstance(v, str) and v}
+    xmp = doc.get_xml_metadata()
+    if xmp:
+        fields["xmp"] = xmp
+    toc = doc.get_toc()
+    if toc:
+        fields["outline"] = "\n".join(entry[1] for entry in toc)
+    leaking = sorted(k for k, v in fields.items() if _count_matches(v, matcher, patterns))
+
+    return {
+        "passed": all(p["passed"] for p in pages) and not annotations and not leaking,
+        "pages": pages,
+        "annotations": annotations,
+        "metadata": {"passed": not leaking, "fields": leaking},
+    }
+
+
+def find_matches(input_path: str, keywords: list[str], pages: list[int] = None,
+                 patterns: list[str] = None, input_hash: str = None,
+                 candidate_pages: list[int] = None, ocr: bool = False,
+                 ocr_dpi: int = 300, ocr_language: str = "eng",
+                 ocr_cache_dir: str = None) -> dict:
+    """
+    Dry run of the keyword and pattern search in redact_text: nothing is
+    annotated, applied or saved. With `input_hash`, the parsed document and
+    page text are reused from this process's caches. `ocr` searches scanned
+    pages as redact_text does.
+
+    Returns {"keywords": [...], "patterns": [...], "pages_scanned": n}, with
+    one entry per keyword / pattern: {"keyword" or "pattern", "total",
+    "pages": [{"page", "count", "rects"}]}, rects being [x0, y0, x1, y1]
+    lists as they would be redacted.
+    """
+    matcher = compile_keywords(keywords)
+    compiled = compile_patterns(patterns)
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input file not found: {input_path}")
+
+    keyword_hits = [{} for _ in matcher.keywords]
+    pattern_hits = [{} for _ in compiled.names]
+
+    def record(hits: dict, i: int, text, start: int, end: int):
+        entry = hits.setdefault(i, {"page": i, "count": 0, "rects": []})
+        entry["count"] += 1
+        entry["rects"].extend([round(v, 2) for v in rect] for rect in text.rects(start, end))
+
+    if input_hash:
+        opened = open_document(input_path, input_hash)
+    else:
+        opened = contextlib.closing(fitz.open(input_path))
+    with opened as doc:
+        if pages:
+            selected = sorted(p for p in set(pages) if 0 <= p < len(doc))
+        else:
+            selected = list(range(len(doc)))
+        if candidate_pages is not None:
+            candidates = set(candidate_pages)
+            selected = [p for p in selected if p in candidates]
+
+        if matcher or compiled:
+            ocr_texts = {}
+            if ocr:
+                ocr_texts = _ocr_scanned_pages(doc, input_path, selected, input_hash,
+                                               ocr_dpi, ocr_language, ocr_cache_dir, 1)
+            for i in selected:
+                text = ocr_texts.get(i) or page_text(doc[i], input_hash, i)
+                for start, end, n in matcher.find(text.text):
+                    record(keyword_hits[n], i, text, start, end)
+                for start, end, n in compiled.find(text.text):
+                    record(pattern_hits[n], i, text, start, end)
+
+    def summary(key: str, names: list[str], hits: list[dict]) -> list[dict]:
+        return [
+            {key: name, "total": sum(e["count"] for e in by_page.values()),
+             "pages": [by_page[i] for i in sorted(by_page)]}
+            for name, by_page in zip(names, hits)
+        ]
+
+    return {
+        "keywords": summary("keyword", matcher.keywords, keyword_hits),
+        "patterns": summary("pattern", compiled.names, pattern_hits),
+        "pages_scanned": len(selected),
+    }
+
 
 def redact_text(input_path: str, output_path: str, keywords: list[str],
-                pages: list[int] = None, placeholder: str = "[---REDACTED---]",
-                remove_images: bool = False, manual_boxes: list[dict] = None):
+                pages: list[int] = None, placeholder: str = DEFAULT_PLACEHOLDER,
+                remove_images: bool = False, manual_boxes: list[dict] = None,
+                page_workers: int = 1, min_parallel_pages: int = 200,
+                patterns: list[str] = None, progress=None,
+                save_mode: str = "balanced", linearize: bool = False,
+                diff_dir: str = None, diff_dpi: int = 40,
+                input_hash: str = None, candidate_pages: list[int] = None,
+                ocr: bool = False, ocr_dpi: int = 300, ocr_language: str = "eng",
+                ocr_cache_dir: str = None, image_mode: str = "all",
+                image_min_size: float = 0, image_hashes: list[str] = None,
+                fill: tuple = DEFAULT_FILL, verify: bool = False) -> dict:
     """
     Redacts keywords and/or specific rectangular areas from a PDF file.
-    Also allows removing images from selected pages.
+    Redacted areas are filled with `fill` (RGB, 0..1) and labelled with
+    `placeholder`. Also allows removing images from selected pages: with `remove_images`,
+    `image_mode` picks which ones ("all", "overlap" or "pixelate", see
+    ImagePolicy) and `image_min_size` spares small ones; images matching
+    `image_hashes` are removed regardless. Images removed by "all" or by
+    hash are removed from the document, so also from unselected pages that
+    share them.
+
+    Keywords are matched case-insensitively as whole words, all of them in a
+    single pass over each page's text. `patterns` may hold built-in pattern
+    names (see app.patterns.BUILTIN_PATTERNS) and regular expressions, which
+    are matched against the same extracted text.
+
+    When `page_workers` > 1 and at least `min_parallel_pages` pages are
+    selected, the pages are redacted in chunks by separate worker processes
+    and stitched back together; each page is redacted exactly as in the
+    serial path.
+
+    `progress`, if given, is called as progress(pages_done, pages_total) while
+    the selected pages are processed.
+
+    Redactions are only applied on pages that actually received redaction
+    annotations or lost images. The output is saved with one of SAVE_PRESETS
+    (optionally linearized); if no page changed, the input is copied as-is.
+    Incremental saves are deliberately not used, since they would keep the
+    original, unredacted objects in the file.
+
+    With `diff_dir`, low-resolution before/after renders of every modified
+    page are written there (see _redact_page) during the same pass; the
+    directory is emptied first.
+
+    `input_hash` is the SHA-256 of the input; when given, page text is cached
+    per worker process under it, so repeated redactions of one upload skip
+    text extraction on the serially processed pages.
+
+    `candidate_pages`, if given, are the only pages that can possibly change
+    (e.g. found through the text index); other selected pages are skipped
+    without being visited.
+
+    With `ocr`, selected pages that have no text layer but show images are
+    OCR'd with Tesseract (at `ocr_dpi`, in `ocr_language`) before keywords
+    and patterns are searched, using up to `page_workers` processes. OCR
+    text is cached in `ocr_cache_dir` per (input_hash, page, dpi, language),
+    so re-redacting a scan with a new policy doesn't OCR it again.
+
+    With `verify`, the redacted document is checked with verify_redaction
+    before it is saved, reusing the open document; the result is reported
+    under "verification" (None otherwise).
+
+    Returns a report with the output path, the modified pages (0-indexed),
+    the number of pages visited and skipped, the pages searched through OCR,
+    the number of keyword and pattern matches, the verification, the save
+    options used and timings: wall-clock total, seconds per stage (open,
+    ocr, extract, search, annotate, images, apply, diff, stitch, verify, save;
+    summed over workers in parallel mode), the slowest pages, and per-page
+    stage seconds under "page_timings".
     """
 
     # Make sure input file exists
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"Input file not found: {input_path}")
 
+    rules = _compile_rules(keywords, patterns, manual_boxes, remove_images, image_mode,
+                           image_min_size, image_hashes, save_mode)
+    timer = StageTimer()
+    started = time.perf_counter()
+    if diff_dir:
+        _reset_dir(diff_dir)
+
     # Try opening the PDF
     try:
-        doc = fitz.open(input_path)
+        with timer.stage("open"):
+            doc = fitz.open(input_path)
     except Exception as e:
         raise ValueError(f"Failed to open PDF: {e}")
 
     try:
-        for i, page in enumerate(doc):
-            # If pages are specified, skip everything else
-            if pages is not None and i not in pages:
-                continue
-
-            # Search for each keyword and mark it for redaction
-            for keyword in keywords:
-                if not keyword.strip():
-                    continue  # Skip empty strings
-                try:
-                    matches = page.search_for(keyword)
-                    for inst in matches:
-                        page.add_redact_annot(inst, fill=(1, 1, 0), text=placeholder)
-                except Exception as e:
-                    print(f"Error searching keyword '{keyword}' on page {i}: {e}")
-
-            # Handle manual redaction boxes, if provided
-            if manual_boxes:
-                for box in manual_boxes:
-                    if box.get("page") != i:
-                        continue
-                    try:
-                        # Validate and create rectangle
-                        rect = fitz.Rect(
-                            max(0, box["x0"]),
-                            max(0, box["y0"]),
-                            max(0, box["x1"]),
-                            max(0, box["y1"]),
-                        )
-                        page.add_redact_annot(rect, fill=(1, 1, 0), text=placeholder)
-                    except Exception as e:
-                        print(f"Invalid box format on page {i}: {e}")
-
-            # If images should be removed, go for it
-            if remove_images:
-                try:
-                    for img in page.get_images(full=True):
-                        xref = img[0]
-                        page.delete_image(xref)
-                except Exception as e:
-                    print(f"Failed to remove image on page {i}: {e}")
-
-            # Finally, apply all the redactions made above
-            try:
-                page.apply_redactions()
-            except Exception as e:
-                print(f"Failed to apply redactions on page {i}: {e}")
+        result = _redact_document(
+            doc, rules, timer, pages, placeholder, fill, verify,
+            input_path=input_path, page_workers=page_workers,
+            min_parallel_pages=min_parallel_pages, progress=progress,
+            diff_dir=diff_dir, diff_dpi=diff_dpi, input_hash=input_hash,
+            candidate_pages=candidate_pages, ocr=ocr, ocr_dpi=ocr_dpi,
+            ocr_language=ocr_language, ocr_cache_dir=ocr_cache_dir,
+        )
 
         # Ensure output directory exists
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-        # Save and close the document
-        doc.save(output_path)
+        # Save and close the document; nothing changed means nothing to rewrite
+        with timer.stage("save"):
+            if result["pages_modified"]:
+                save_options = _save(doc, output_path, save_mode, linearize)
+            else:
+                shutil.copyfile(input_path, output_path)
+                save_options = None
         doc.close()
 
-        return output_path
+        return {"output_path": output_path, **_report(result, save_options, timer, started)}
 
     except Exception as e:
         doc.close()
         raise RuntimeError(f"Redaction process failed: {e}")
+
+
+def redact_bytes(data: bytes, keywords: list[str], pages: list[int] = None,
+                 placeholder: str = DEFAULT_PLACEHOLDER, remove_images: bool = False,
+                 manual_boxes: list[dict] = None, patterns: list[str] = None,
+                 save_mode: str = "balanced", image_mode: str = "all",
+                 image_min_size: float = 0, image_hashes: list[str] = None,
+                 fill: tuple = DEFAULT_FILL, verify: bool = False) -> tuple:
+    """
+    In-memory counterpart of redact_text for documents small enough to hold
+    in memory: the PDF is opened from `data` and written with tobytes, so
+    nothing touches disk. Pages are redacted serially, exactly as in
+    redact_text; OCR, diff renders and linearization are not available.
+
+    Returns (output bytes, report); the report has the same keys as
+    redact_text's except output_path. If no page changed, `data` itself is
+    returned.
+    """
+    rules = _compile_rules(keywords, patterns, manual_boxes, remove_images, image_mode,
+                           image_min_size, image_hashes, save_mode)
+    timer = StageTimer()
+    started = time.perf_counter()
+
+    try:
+        with timer.stage("open"):
+            doc = fitz.open(stream=data, filetype="pdf")
+    except Exception as e:
+        raise ValueError(f"Failed to open PDF: {e}")
+
+    try:
+        result = _redact_document(doc, rules, timer, pages, placeholder, fill, verify)
+        with timer.stage("save"):
+            if result["pages_modified"]:
+                save_options = dict(SAVE_PRESETS[save_mode])
+                output = doc.tobytes(**save_options)
+                save_options["linear"] = False
+            else:
+                output = data
+                save_options = None
+    except Exception as e:
+        raise RuntimeError(f"Redaction process failed: {e}")
+    finally:
+        doc.close()
+
+    return output, _report(result, save_options, timer, started)
+
+
+def _compile_rules(keywords: list[str], patterns: list[str], manual_boxes: list[dict],
+                   remove_images: bool, image_mode: str, image_min_size: float,
+                   image_hashes: list[str], save_mode: str) -> tuple:
+    """Check and compile a policy into (matcher, patterns, compiled patterns, boxes by page, images)."""
+    matcher = compile_keywords(keywords)
+    patterns = normalize_patterns(patterns)
+    compiled = compile_patterns(patterns)
+    if save_mode not in SAVE_PRESETS:
+        raise ValueError(f"Unknown save mode '{save_mode}', expected one of {sorted(SAVE_PRESETS)}")
+    images = ImagePolicy(image_mode if remove_images else None, image_min_size, image_hashes)
+    return matcher, patterns, compiled, _index_boxes(manual_boxes), images or None
+
+
+def _redact_document(doc, rules: tuple, timer: StageTimer, pages: list[int], placeholder: str,
+                     fill: tuple, verify: bool, input_path: str = None, page_workers: int = 1,
+                     min_parallel_pages: int = 200, progress=None, diff_dir: str = None,
+                     diff_dpi: int = 40, input_hash: str = None, candidate_pages: list[int] = None,
+                     ocr: bool = False, ocr_dpi: int = 300, ocr_language: str = "eng",
+                     ocr_cache_dir: str = None) -> dict:
+    """
+    The redaction pass shared by redact_text and redact_bytes, on an open
+    document and with `rules` from _compile_rules: page selection, OCR, the
+    serial or page-parallel pass and verification. Saving is left to the
+    caller. Returns the modified, processed, skipped and OCR'd pages, the
+    match count and the verification.
+    """
+    matcher, patterns, compiled, boxes_by_page, images = rules
+
+    # No page selection means every page
+    if pages:
+        selected = sorted(p for p in set(pages) if 0 <= p < len(doc))
+    else:
+        selected = list(range(len(doc)))
+    if candidate_pages is not None:
+        candidates = set(candidate_pages)
+        skipped = len(selected)
+        selected = [p for p in selected if p in candidates]
+        skipped -= len(selected)
+    else:
+        skipped = 0
+
+    ocr_texts = {}
+    if ocr and (matcher or compiled):
+        with timer.stage("ocr"):
+            ocr_texts = _ocr_scanned_pages(doc, input_path, selected, input_hash, ocr_dpi,
+                                           ocr_language, ocr_cache_dir, page_workers)
+
+    unsearched = []  # pages whose text couldn't be searched
+    if page_workers > 1 and len(selected) >= max(min_parallel_pages, 2):
+        modified = _redact_parallel(doc, input_path, selected, matcher, patterns,
+                                    placeholder, images, boxes_by_page,
+                                    min(page_workers, len(selected)), progress,
+                                    timer, diff_dir, diff_dpi, ocr_texts, fill, unsearched)
+    else:
+        # Visit only the selected pages
+        modified = []
+        for done, i in enumerate(selected, start=1):
+            if _redact_page(doc[i], i, matcher, compiled, placeholder, images,
+                            boxes_by_page.get(i, []), timer, diff_dir, diff_dpi,
+                            input_hash, ocr_texts.get(i), fill, unsearched):
+                modified.append(i)
+            if progress:
+                progress(done, len(selected))
+
+    verification = None
+    if verify:
+        with timer.stage("verify"):
+            verification = verify_redaction(doc, selected, matcher, compiled,
+                                            unsearched)
+
+    return {
+        "pages_modified": modified,
+        "pages_processed": len(selected),
+        "pages_skipped": skipped,
+        "pages_ocr": sorted(ocr_texts),
+        "matches": timer.counts.get("matches", 0),
+        "verification": verification,
+    }
+
+
+def _report(result: dict, save_options: dict, timer: StageTimer, started: float) -> dict:
+    """The report of redact_text and redact_bytes, from _redact_document's result."""
+    return {
+        **result,
+        "save_options": save_options,
+        "timings": {
+            "total": time.perf_counter() - started,
+            "stages": timer.stages,
+            "slowest_pages": timer.slowest_pages(),
+        },
+        "page_timings": timer.pages,
+    }
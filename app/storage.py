@@ -0,0 +1,290 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from app.hashing import sha256_file
+
+_KEY = re.compile(r"[0-9a-f]{64}")
+
+# Staged files older than this were left behind by a crashed writer
+_STAGING_MAX_AGE = 24 * 3600
+
+
+def is_object_key(value: str) -> bool:
+    """Whether `value` looks like a content hash, i.e. can name a stored object."""
+    return bool(_KEY.fullmatch(value or ""))
+
+
+class StorageBackend(ABC):
+    """
+    Where objects live. Objects are immutable files named by the SHA-256 of
+    their content, each with a small JSON metadata record. Backends must be
+    safe to use from several threads and processes at once.
+    """
+
+    @abstractmethod
+    def staging_dir(self) -> str:
+        """Directory for files being written before put(), on the same filesystem."""
+
+    @abstractmethod
+    def put(self, key: str, src: str, meta: dict):
+        """Move the finished file `src` in as object `key`, atomically."""
+
+    @abstractmethod
+    def path(self, key: str):
+        """Local file path of an object, or None if there is no such object."""
+
+    @abstractmethod
+    def get_meta(self, key: str):
+        """The metadata record of an object, or None."""
+
+    @abstractmethod
+    def touch(self, key: str):
+        """Mark an object as just used, for garbage collection."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove an object and its metadata; a missing object is not an error."""
+
+    @abstractmethod
+    def entries(self):
+        """Yield (key, size, last used) for every object."""
+
+
+class LocalBackend(StorageBackend):
+    """
+    Objects on a local (or shared) filesystem, sharded by the first two byte
+    pairs of their hash: root/ab/cd/abcd.... Writes go through a temp file and
+    os.replace, so other workers see either nothing or the complete object.
+    The file's atime records when it was last used; the mtime is left alone
+    so hashes memoized on it stay valid.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self._staging = self.root / "tmp"
+        self._staging.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key[2:4] / key
+
+    def staging_dir(self) -> str:
+        return str(self._staging)
+
+    def put(self, key: str, src: str, meta: dict):
+        dest = self._path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # Metadata goes first: an object only counts once its data is in place
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, f"{dest}.json")
+        os.replace(src, dest)
+
+    def path(self, key: str):
+        path = self._path(key)
+        return str(path) if path.is_file() else None
+
+    def get_meta(self, key: str):
+        try:
+            with open(f"{self._path(key)}.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def touch(self, key: str):
+        path = self._path(key)
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+
+    def delete(self, key: str):
+        path = self._path(key)
+        for stale in (path, Path(f"{path}.json")):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+    def entries(self):
+        for shard in self.root.glob("??/??"):
+            for entry in os.scandir(shard):
+                if not is_object_key(entry.name):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.name, st.st_size, st.st_atime
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Objects held in memory, for tests. The engine opens documents by path,
+    so path() writes an object out to a private temp directory on first use.
+    """
+
+    def __init__(self):
+        self._objects = {}  # key -> [data, meta, last used]
+        self._lock = threading.Lock()
+        self._dir = tempfile.mkdtemp(prefix="storage-")
+
+    def staging_dir(self) -> str:
+        return self._dir
+
+    def put(self, key: str, src: str, meta: dict):
+        with open(src, "rb") as f:
+            data = f.read()
+        os.remove(src)
+        with self._lock:
+            self._objects[key] = [data, meta, time.time()]
+
+    def path(self, key: str):
+        with self._lock:
+            entry = self._objects.get(key)
+        if entry is None:
+            return None
+        path = os.path.join(self._dir, key)
+        if not os.path.exists(path):
+            fd, tmp = tempfile.mkstemp(dir=self._dir, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(entry[0])
+            os.replace(tmp, path)
+        return path
+
+    def get_meta(self, key: str):
+        with self._lock:
+            entry = self._objects.get(key)
+        return None if entry is None else entry[1]
+
+    def touch(self, key: str):
+        with self._lock:
+            if key in self._objects:
+                self._objects[key][2] = time.time()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._objects.pop(key, None)
+        try:
+            os.remove(os.path.join(self._dir, key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        with self._lock:
+            items = [(key, len(data), used) for key, (data, _, used) in self._objects.items()]
+        yield from items
+
+
+def make_backend(kind: str, root: str) -> StorageBackend:
+    if kind == "local":
+        return LocalBackend(root)
+    if kind == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend '{kind}', expected 'local' or 'memory'")
+
+
+class ObjectStore:
+    """
+    Content-addressed store on top of a backend: identical content is kept
+    once, whoever uploads it under whatever name. Objects unused for `ttl`
+    seconds (0: forever) are deleted by gc(), which then evicts the least
+    recently used ones until the store fits in `max_bytes` (0: no limit).
+    `on_delete`, if given, is called with the key of every object gc()
+    deletes, so files derived from it can go too.
+    """
+
+    def __init__(self, backend: StorageBackend, ttl: int = 0, max_bytes: int = 0,
+                 on_delete=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.on_delete = on_delete
+        self.collected = 0
+
+    def staging_path(self, suffix: str = "") -> str:
+        """A fresh, unique path to write a new object to before put()."""
+        fd, path = tempfile.mkstemp(dir=self.backend.staging_dir(), prefix=".new-", suffix=suffix)
+        os.close(fd)
+        return path
+
+    def put(self, src: str, meta: dict = None, digest: str = None) -> str:
+        """
+        Move the file at `src` into the store and return its content hash
+        (computed unless `digest` is given). Storing content that is already
+        there only refreshes it.
+        """
+        digest = digest or sha256_file(src)
+        if self.backend.path(digest) is not None:
+            os.remove(src)
+            self.backend.touch(digest)
+            return digest
+        meta = {**(meta or {}), "size": os.path.getsize(src), "created_at": time.time()}
+        self.backend.put(digest, src, meta)
+        return digest
+
+    def path(self, digest: str):
+        """Local path of an object (marking it as used), or None."""
+        if not is_object_key(digest):
+            return None
+        path = self.backend.path(digest)
+        if path is not None:
+            self.backend.touch(digest)
+        return path
+
+    def meta(self, digest: str):
+        return self.backend.get_meta(digest) if is_object_key(digest) else None
+
+    def gc(self, now: float = None) -> int:
+        """Delete expired objects, then least recently used ones over quota. Returns the count."""
+        now = now or time.time()
+        entries = sorted(self.backend.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for key, size, last_used in entries:
+            expired = self.ttl and now - last_used > self.ttl
+            over_quota = self.max_bytes and total > self.max_bytes
+            if not expired and not over_quota:
+                # Sorted by last use: nothing later is expired either
+                break
+            self.backend.delete(key)
+            if self.on_delete is not None:
+                self.on_delete(key)
+            total -= size
+            removed += 1
+        self.collected += removed
+
+        for entry in os.scandir(self.backend.staging_dir()):
+            if entry.name.startswith(".new-"):
+                try:
+                    if now - entry.stat().st_mtime > _STAGING_MAX_AGE:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+def link(alias: Path, target: str):
+    """Point `alias` (a friendly name such as uploads/contract.pdf) at an object, atomically."""
+    tmp = alias.with_name(f".link-{os.getpid()}-{threading.get_ident()}-{alias.name}")
+    os.symlink(os.path.abspath(target), tmp)
+    os.replace(tmp, alias)
+
+
+def prune_links(directory: Path) -> int:
+    """Remove aliases in `directory` whose object has been collected."""
+    removed = 0
+    for entry in os.scandir(directory):
+        if entry.is_symlink() and not os.path.exists(entry.path):
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
@@ -0,0 +1,217 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from pathlib import Path
+
+import fitz  # PyMuPDF for working with PDFs
+
+from app.doccache import page_text
+from app.matching import _fold, normalize_keyword
+
+# Bump when the file layout or tokenization changes; older index files are rebuilt
+INDEX_VERSION = 1
+_MAGIC = b"PDFIDX1\n"
+
+
+def tokenize(text: str):
+    """
+    Yield (start, end, token) for each run of alphanumeric characters, lower-
+    cased like KeywordMatcher. A whole-word keyword match always consists of
+    complete tokens, which is what makes the index safe as a page filter.
+    """
+    folded = _fold(text)
+    start = None
+    for pos, c in enumerate(folded):
+        if c.isalnum():
+            if start is None:
+                start = pos
+        elif start is not None:
+            yield start, pos, folded[start:pos]
+            start = None
+    if start is not None:
+        yield start, len(folded), folded[start:]
+
+
+def index_path(directory: str, digest: str) -> Path:
+    return Path(directory) / digest[:2] / f"{digest}.idx"
+
+
+def build_index(input_path: str, digest: str, directory: str) -> str:
+    """
+    Extract every page's text and write a columnar token index for the file
+    with content hash `digest`. Returns the index path. Layout, after a JSON
+    header: per-page token offsets, per-token term ids and float32 boxes, the
+    term strings, and per-term sorted page postings, each a flat array.
+    """
+    terms = {}
+    page_offsets = array("I", [0])
+    term_ids = array("I")
+    coords = array("f")
+    postings = []
+    redact_annot_pages = []
+
+    doc = fitz.open(input_path)
+    try:
+        for i, page in enumerate(doc):
+            text = page_text(page, digest, i)
+            for start, end, token in tokenize(text.text):
+                rects = text.rects(start, end)
+                if not rects:
+                    continue
+                rect = rects[0]
+                for r in rects[1:]:
+                    rect |= r
+                term = terms.get(token)
+                if term is None:
+                    term = terms[token] = len(terms)
+                    postings.append(array("I"))
+                if not postings[term] or postings[term][-1] != i:
+                    postings[term].append(i)
+                term_ids.append(term)
+                coords.extend((rect.x0, rect.y0, rect.x1, rect.y1))
+            page_offsets.append(len(term_ids))
+            # Pages already carrying redact annotations change even without hits
+            if next(page.annots(types=[fitz.PDF_ANNOT_REDACT]), None) is not None:
+                redact_annot_pages.append(i)
+        page_count = len(doc)
+    finally:
+        doc.close()
+
+    posting_offsets = array("I", [0])
+    posting_pages = array("I")
+    for pages in postings:
+        posting_pages.extend(pages)
+        posting_offsets.append(len(posting_pages))
+
+    sections = {
+        "page_offsets": page_offsets.tobytes(),
+        "term_ids": term_ids.tobytes(),
+        "coords": coords.tobytes(),
+        "terms": "\n".join(terms).encode("utf-8"),
+        "posting_offsets": posting_offsets.tobytes(),
+        "posting_pages": posting_pages.tobytes(),
+    }
+    header = {"version": INDEX_VERSION, "page_count": page_count,
+              "redact_annot_pages": redact_annot_pages, "sections": {}}
+    offset = 0
+    for name, data in sections.items():
+        header["sections"][name] = [offset, len(data)]
+        offset += _padded(len(data))
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    path = index_path(directory, digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (_padded(f.tell()) - f.tell()))
+        for data in sections.values():
+            f.write(data)
+            f.write(b"\0" * (_padded(len(data)) - len(data)))
+    os.replace(tmp, path)
+    return str(path)
+
+
+def _padded(n: int) -> int:
+    return (n + 7) // 8 * 8
+
+
+class TextIndex:
+    """
+    Read-only view of an index file. The arrays are memory-mapped, so opening
+    an index costs one read of the term strings however large the document.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"Not a text index: {path}")
+        (header_len,) = struct.unpack_from("<I", self._mm, len(_MAGIC))
+        start = len(_MAGIC) + 4
+        header = json.loads(self._mm[start:start + header_len])
+        if header["version"] != INDEX_VERSION:
+            raise ValueError(f"Text index version {header['version']} is not supported")
+        self.page_count = header["page_count"]
+        self.redact_annot_pages = header["redact_annot_pages"]
+
+        base = _padded(start + header_len)
+        view = memoryview(self._mm)
+        s = {name: view[base + off:base + off + length]
+             for name, (off, length) in header["sections"].items()}
+        self._page_offsets = s["page_offsets"].cast("I")
+        self._term_ids = s["term_ids"].cast("I")
+        self._coords = s["coords"].cast("f")
+        self._posting_offsets = s["posting_offsets"].cast("I")
+        self._posting_pages = s["posting_pages"].cast("I")
+        terms = bytes(s["terms"]).decode("utf-8")
+        # Every view must be released before the map can be closed
+        self._views = [self._page_offsets, self._term_ids, self._coords,
+                       self._posting_offsets, self._posting_pages, *s.values(), view]
+        self._terms = {t: n for n, t in enumerate(terms.split("\n"))} if terms else {}
+
+    @classmethod
+    def load(cls, directory: str, digest: str) -> "TextIndex":
+        """Open the index for a content hash, or return None if there is no usable one."""
+        path = index_path(directory, digest)
+        try:
+            return cls(str(path))
+        except (OSError, ValueError):
+            return None
+
+    def _pages_of(self, term: str) -> set:
+        n = self._terms.get(term)
+        if n is None:
+            return set()
+        return set(self._posting_pages[self._posting_offsets[n]:self._posting_offsets[n + 1]])
+
+    def candidate_pages(self, keyword: str):
+        """
+        Pages that contain every token of `keyword`: a superset of the pages a
+        whole-word match can occur on. None if the keyword has no tokens
+        (then it could match anywhere).
+        """
+        tokens = [t for _, _, t in tokenize(normalize_keyword(keyword))]
+        if not tokens:
+            return None
+        pages = self._pages_of(tokens[0])
+        for token in tokens[1:]:
+            if not pages:
+                break
+            pages &= self._pages_of(token)
+        return pages
+
+    def search(self, query: str) -> list[dict]:
+        """
+        Find `query` as a sequence of consecutive tokens. Returns one entry
+        per page with hits: {"page", "rects"}, one rectangle per hit.
+        """
+        ids = [self._terms.get(t) for _, _, t in tokenize(normalize_keyword(query))]
+        if not ids or None in ids:
+            return []
+        pages = self.candidate_pages(query)
+        results = []
+        for page in sorted(pages):
+            start, end = self._page_offsets[page], self._page_offsets[page + 1]
+            tokens = self._term_ids[start:end]
+            rects = []
+            for k in range(len(tokens) - len(ids) + 1):
+                if tokens[k] != ids[0] or list(tokens[k:k + len(ids)]) != ids:
+                    continue
+                rect = None
+                for t in range(start + k, start + k + len(ids)):
+                    r = fitz.Rect(*self._coords[4 * t:4 * t + 4])
+                    rect = r if rect is None else rect | r
+                rects.append([round(v, 2) for v in rect])
+            if rects:
+                results.append({"page": page, "rects": rects})
+        return results
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._mm.close()
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the redaction engine and the HTTP API.
+
+Run `python -m benchmarks --help` from the repository root.
+"""
@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF for working with PDFs
+
+from benchmarks import api, engine
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def _key(row: dict) -> tuple:
+    """Identify a benchmark case independent of its measurements."""
+    measured = {"min_s", "median_s", "runs", "pages_per_s", "elapsed_s", "requests_per_s",
+                "steps", "pages_modified", "bytes_in"}
+    return tuple(sorted((k, json.dumps(v)) for k, v in row.items() if k not in measured))
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Print per-case ratios between two result files; non-zero exit on regressions."""
+    with open(old_path) as f:
+        old = {_key(r): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+
+    regressions = 0
+    for row in new:
+        before = old.get(_key(row))
+        if before is None:
+            continue
+        metric = "median_s" if "median_s" in row else "elapsed_s"
+        ratio = row[metric] / before[metric] if before[metric] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- slower"
+            regressions += 1
+        label = ", ".join(f"{k}={json.loads(v)}" for k, v in _key(row))
+        print(f"{ratio:6.2f}x  {label}{flag}")
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmark the redaction engine and API.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run benchmarks and write a JSON result file")
+    run.add_argument("--suite", choices=["engine", "api", "all"], default="all")
+    run.add_argument("--quick", action="store_true", help="small matrix for smoke testing")
+    run.add_argument("--repeat", type=int, default=3, help="timed runs per engine case")
+    run.add_argument("--page-workers", type=int, default=1)
+    run.add_argument("--requests", type=int, default=20, help="API round trips")
+    run.add_argument("--concurrency", type=int, default=4, help="concurrent API clients")
+    run.add_argument("--output", default="bench_results.json")
+
+    cmp = sub.add_parser("compare", help="compare two result files")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.10,
+                     help="relative slowdown reported as a regression")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args.old, args.new, args.threshold)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="redaction-bench-") as workdir:
+        if args.suite in ("engine", "all"):
+            print("Running engine benchmarks...")
+            results += engine.run(workdir, quick=args.quick, repeat=args.repeat,
+                                  page_workers=args.page_workers)
+        if args.suite in ("api", "all"):
+            print("Running API benchmarks...")
+            results += api.run(workdir, quick=args.quick, requests=args.requests,
+                               concurrency=args.concurrency)
+
+    payload = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "pymupdf": fitz.VersionBind,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
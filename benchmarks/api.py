@@ -0,0 +1,113 @@
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.corpus import NAMES, make_pdf
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+
+def _percentiles(values: list[float]) -> dict:
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def pick(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "p50_s": pick(0.50),
+        "p90_s": pick(0.90),
+        "p99_s": pick(0.99),
+        "mean_s": statistics.mean(values),
+        "max_s": values[-1],
+    }
+
+
+async def _cycle(client, name: str, data: bytes, keywords: str, timings: dict):
+    """One upload -> redact -> download round trip, timing each step."""
+    start = time.perf_counter()
+    r = await client.post("/upload", files={"file": (name, data, "application/pdf")})
+    r.raise_for_status()
+    uploaded = time.perf_counter()
+
+    while True:
+        r = await client.post("/redact/", json={"filename": name, "keywords": keywords})
+        if r.status_code != 503:
+            break
+        await asyncio.sleep(0.05)
+    r.raise_for_status()
+    redacted = time.perf_counter()
+
+    r = await client.get(f"/download/{name}")
+    r.raise_for_status()
+    done = time.perf_counter()
+
+    timings["upload"].append(uploaded - start)
+    timings["redact"].append(redacted - uploaded)
+    timings["download"].append(done - redacted)
+    timings["total"].append(done - start)
+
+
+async def _load_test(app, data: bytes, requests: int, concurrency: int) -> dict:
+    timings = {"upload": [], "redact": [], "download": [], "total": []}
+    limit = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async def one(n: int):
+        async with limit:
+            # Distinct names and keywords so no request is a result cache hit
+            await _cycle(client, f"bench_{n}.pdf", data, ",".join(NAMES[n % 50:n % 50 + 20]), timings)
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(one(n) for n in range(requests)))
+            elapsed = time.perf_counter() - start
+
+    return {
+        "elapsed_s": elapsed,
+        "requests_per_s": requests / elapsed,
+        "bytes_in": len(data) * requests,
+        "steps": {step: _percentiles(values) for step, values in timings.items()},
+    }
+
+
+def run(workdir: str, quick: bool = False, pages: int = 50, requests: int = 20,
+        concurrency: int = 4) -> list[dict]:
+    """
+    Load-test /upload -> /redact/ -> /download in-process through an ASGI
+    client. The app is imported with `workdir` as the working directory so
+    its uploads/ and outputs/ folders end up there.
+    """
+    if httpx is None:
+        raise RuntimeError("The API benchmark needs httpx: pip install httpx")
+    if quick:
+        pages, requests, concurrency = 10, 4, 2
+
+    path = make_pdf(os.path.join(workdir, "api_corpus.pdf"), pages, images_per_page=1)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from app.app import app, result_cache
+        result_cache.max_bytes = 0  # measure real redactions, not cache copies
+        result = asyncio.run(_load_test(app, data, requests, concurrency))
+    finally:
+        os.chdir(cwd)
+
+    print(f"  api pages={pages} requests={requests} concurrency={concurrency}: "
+          f"{result['requests_per_s']:.2f} req/s")
+    return [{
+        "benchmark": "api.upload_redact_download",
+        "pages": pages,
+        "requests": requests,
+        "concurrency": concurrency,
+        **result,
+    }]
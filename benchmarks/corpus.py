@@ -0,0 +1,68 @@
+import random
+
+import fitz  # PyMuPDF for working with PDFs
+
+# Vocabulary for filler text; the NAMES are what benchmarks redact
+WORDS = (
+    "agreement party shall notice term payment services confidential clause "
+    "period effective date obligations liability section provided written "
+    "contract schedule amendment invoice delivery warranty breach remedy"
+).split()
+NAMES = [f"Person{n:04d}" for n in range(1000)]
+
+
+def _text_lines(rng: random.Random, words_per_page: int, names_rate: float) -> list[str]:
+    lines, line = [], []
+    for _ in range(words_per_page):
+        word = rng.choice(NAMES) if rng.random() < names_rate else rng.choice(WORDS)
+        line.append(word)
+        if len(line) == 12:
+            lines.append(" ".join(line))
+            line = []
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def _image_pixmap(rng: random.Random, size: int = 64) -> fitz.Pixmap:
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, size, size), False)
+    pix.clear_with(rng.randrange(32, 224))
+    return pix
+
+
+def make_pdf(path: str, pages: int, words_per_page: int = 300, images_per_page: int = 0,
+             scanned_ratio: float = 0.0, names_rate: float = 0.02, seed: int = 0) -> str:
+    """
+    Build a synthetic PDF at `path`.
+
+    Every page gets `words_per_page` words of filler text sprinkled with names
+    from NAMES and `images_per_page` small embedded images. A `scanned_ratio`
+    share of the pages is rendered to a bitmap and stored as an image only,
+    like a scan without a text layer.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    shared_logo = _image_pixmap(rng)
+    for n in range(pages):
+        page = doc.new_page()
+        lines = _text_lines(rng, words_per_page, names_rate)
+        body = fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50)
+        page.insert_textbox(body, "\n".join(lines), fontsize=8)
+        for k in range(images_per_page):
+            x = 60 + (k % 4) * 120
+            y = page.rect.height - 150 - (k // 4) * 90
+            rect = fitz.Rect(x, y, x + 80, y + 80)
+            # Every other image is a logo shared by all pages, like real letterheads
+            pix = shared_logo if k % 2 == 0 else _image_pixmap(rng)
+            page.insert_image(rect, pixmap=pix)
+
+        if rng.random() < scanned_ratio:
+            # Replace the page with a picture of itself: no text layer left
+            pix = page.get_pixmap(dpi=100)
+            page.add_redact_annot(page.rect)
+            page.apply_redactions()
+            page.insert_image(page.rect, pixmap=pix)
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+    return path
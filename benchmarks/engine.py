@@ -0,0 +1,87 @@
+import itertools
+import os
+import random
+import statistics
+import time
+
+from app.redaction import redact_text
+from benchmarks.corpus import NAMES, make_pdf
+
+# Benchmark matrix: every combination of these axes is timed
+PAGE_COUNTS = [20, 200]
+KEYWORD_COUNTS = [0, 10, 200]
+BOX_COUNTS = [0, 1000]
+PAGE_SELECTIONS = ["all", "half"]
+REMOVE_IMAGES = [False, True]
+
+# Smaller matrix for --quick smoke runs
+QUICK_AXES = [[20], [0, 50], [100], ["all"], [False, True]]
+
+
+def _boxes(rng: random.Random, count: int, pages: int) -> list[dict]:
+    boxes = []
+    for _ in range(count):
+        x, y = rng.uniform(50, 450), rng.uniform(50, 700)
+        boxes.append({"page": rng.randrange(pages), "x0": x, "y0": y, "x1": x + 80, "y1": y + 12})
+    return boxes
+
+
+def _time(fn, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"min_s": min(times), "median_s": statistics.median(times), "runs": repeat}
+
+
+def run(workdir: str, quick: bool = False, repeat: int = 3, page_workers: int = 1) -> list[dict]:
+    """Time redact_text across the benchmark matrix and return one row per case."""
+    axes = [PAGE_COUNTS, KEYWORD_COUNTS, BOX_COUNTS, PAGE_SELECTIONS, REMOVE_IMAGES]
+    if quick:
+        axes = QUICK_AXES
+    rng = random.Random(42)
+    results = []
+
+    corpus = {}
+    for pages in axes[0]:
+        path = os.path.join(workdir, f"corpus_{pages}.pdf")
+        make_pdf(path, pages, images_per_page=2, scanned_ratio=0.1)
+        corpus[pages] = path
+
+    output_path = os.path.join(workdir, "out", "engine.pdf")
+    for pages, keywords, boxes, selection, remove_images in itertools.product(*axes):
+        keyword_list = NAMES[:keywords]
+        box_list = _boxes(rng, boxes, pages)
+        selected = list(range(0, pages, 2)) if selection == "half" else None
+
+        def call():
+            return redact_text(
+                input_path=corpus[pages],
+                output_path=output_path,
+                keywords=keyword_list,
+                pages=selected,
+                remove_images=remove_images,
+                manual_boxes=box_list,
+                page_workers=page_workers,
+                min_parallel_pages=2,
+            )
+
+        report = call()  # warm-up, also gives the number of modified pages
+        timing = _time(call, repeat)
+        results.append({
+            "benchmark": "engine.redact_text",
+            "pages": pages,
+            "keywords": keywords,
+            "boxes": boxes,
+            "page_selection": selection,
+            "remove_images": remove_images,
+            "page_workers": page_workers,
+            "pages_modified": len(report["pages_modified"]),
+            "pages_per_s": (len(selected) if selected else pages) / timing["median_s"],
+            **timing,
+        })
+        print(f"  engine pages={pages} keywords={keywords} boxes={boxes} "
+              f"selection={selection} remove_images={remove_images}: "
+              f"{timing['median_s'] * 1000:.1f} ms")
+    return results
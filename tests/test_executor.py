@@ -0,0 +1,34 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.executor import RedactionExecutor
+
+
+def _crash():
+    os._exit(1)
+
+
+def test_a_broken_pool_is_replaced_for_later_jobs():
+    async def scenario():
+        executor = RedactionExecutor(max_workers=1, max_queue=1)
+        try:
+            with pytest.raises(BrokenProcessPool):
+                await executor.run(_crash)
+            assert await executor.run(abs, -3) == 3
+
+            # A pool that broke before the job got in is replaced as well
+            broken = executor._get_pool()
+            with pytest.raises(BrokenProcessPool):
+                await executor.run(_crash)
+            executor._pool = broken
+            with pytest.raises(BrokenProcessPool):
+                await executor.run(abs, -3)
+            assert executor.pending == 0
+            assert await executor.run(abs, -3) == 3
+        finally:
+            executor.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,95 @@
+import fitz
+import pytest
+
+from app.matching import KeywordMatcher, PageText, normalize_keyword
+
+
+def _found(matcher: KeywordMatcher, text: str) -> list:
+    return sorted((text[start:end], matcher.keywords[index]) for start, end, index in matcher.find(text))
+
+
+def test_overlapping_keywords_are_all_found():
+    matcher = KeywordMatcher(["John Smith", "Smith", "Smith Jones", "John"])
+
+    assert _found(matcher, "Dr John Smith Jones") == [
+        ("John", "John"),
+        ("John Smith", "John Smith"),
+        ("Smith", "Smith"),
+        ("Smith Jones", "Smith Jones"),
+    ]
+
+
+def test_keywords_sharing_suffixes_follow_failure_links():
+    matcher = KeywordMatcher(["he", "she", "his", "hers"], whole_words=False)
+
+    assert sorted(matcher.find("ushers")) == [(1, 4, 1), (2, 4, 0), (2, 6, 3)]
+
+
+@pytest.mark.parametrize("text", ["Smith", "Call Smith", "Call Smith.", "Smith\nnext line", "end of line Smith\n"])
+def test_keywords_at_text_and_line_ends(text):
+    assert _found(KeywordMatcher(["smith"]), text) == [("Smith", "smith")]
+
+
+def test_whole_words_only():
+    matcher = KeywordMatcher(["smith"])
+
+    assert _found(matcher, "Smithson and Blacksmith") == []
+    assert _found(KeywordMatcher(["smith"], whole_words=False), "Blacksmith") == [("smith", "smith")]
+
+
+def test_case_folding_keeps_offsets_aligned():
+    # "İ" lower-cases to two characters, which must not shift later matches
+    text = "İSTANBUL office: JOHN smith"
+    matcher = KeywordMatcher(["John Smith"])
+
+    assert _found(matcher, text) == [("JOHN smith", "John Smith")]
+    assert normalize_keyword("  JOHN \t Smith ") == "john smith"
+
+
+def test_duplicate_keywords_are_matched_once():
+    matcher = KeywordMatcher(["John Smith", "john  SMITH", " ", ""])
+
+    assert matcher.keywords == ["John Smith"]
+    assert len(list(matcher.find("John Smith"))) == 1
+    assert not KeywordMatcher(["", "  "])
+
+
+@pytest.fixture
+def page():
+    doc = fitz.open()
+    page = doc.new_page()
+    # Narrow enough that "John" ends the first line and "Smith" starts the second
+    page.insert_textbox(fitz.Rect(72, 72, 130, 200), "Call John Smith today", fontsize=11)
+    page.insert_text((300, 400), "Ends with John")
+    page.insert_text((300, 450), "Smith starts")
+    return page
+
+
+def test_phrase_wrapped_inside_a_block_matches_with_one_rect_per_line(page):
+    text = PageText.from_page(page)
+    matches = list(KeywordMatcher(["john smith"]).find(text.text))
+
+    assert len(matches) == 1
+    start, end, _ = matches[0]
+    rects = text.rects(start, end)
+    assert len(rects) == 2
+    assert rects[0].y1 <= rects[1].y0 + 1
+    # Each rect covers its own word
+    assert page.get_textbox(rects[0]).strip() == "John"
+    assert page.get_textbox(rects[1]).strip() == "Smith"
+
+
+def test_phrases_never_span_blocks(page):
+    text = PageText.from_page(page)
+
+    assert "John\nSmith" in text.text
+    assert _found(KeywordMatcher(["John Smith"]), text.text) == [("John Smith", "John Smith")]
+
+
+def test_rects_skip_separators(page):
+    text = PageText.from_page(page)
+    start = text.text.index("today")
+
+    assert text.rects(start - 1, start) == []
+    [rect] = text.rects(start - 1, start + len("today"))
+    assert page.get_textbox(rect).strip() == "today"
@@ -0,0 +1,141 @@
+import fitz
+import pytest
+
+from app.redaction import redact_bytes, redact_text
+
+KEYWORDS = ["John Smith", "secret"]
+
+
+@pytest.fixture
+def shared_pdf(tmp_path):
+    """
+    Eight pages sharing one image, each with a keyword over the image, a
+    link over "Smith", a link to another page and a note; the first four
+    also carry a Redact annotation from the author.
+    """
+    path = tmp_path / "shared.pdf"
+    doc = fitz.open()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+    pix.set_rect(pix.irect, (0, 120, 200))
+    xref = 0
+    for n in range(8):
+        page = doc.new_page()
+        if xref:
+            page.insert_image(fitz.Rect(300, 50, 400, 150), xref=xref)
+        else:
+            xref = page.insert_image(fitz.Rect(300, 50, 400, 150), pixmap=pix)
+        page.insert_text((72, 100), f"Page {n} John Smith here")
+        page.insert_text((310, 100), "secret")
+        page.insert_link({"kind": fitz.LINK_URI, "from": page.search_for("Smith")[0], "uri": "https://example.com"})
+        if n < 4:
+            page.add_redact_annot(fitz.Rect(72, 200, 200, 220))
+        page.add_text_annot((500, 500), "note")
+    for n in range(8):
+        doc[n].insert_link({"kind": fitz.LINK_GOTO, "from": fitz.Rect(72, 300, 200, 320),
+                            "page": (n + 3) % 8, "to": fitz.Point(0, 0)})
+    doc.set_page_labels([{"startpage": 0, "prefix": "A-", "style": "D", "firstpagenum": 1}])
+    doc.embfile_add("note.txt", b"attached")
+    doc.save(path)
+    return path
+
+
+def _summary(path) -> list:
+    """What a reader sees on each page: text, annotations, links and pixels."""
+    doc = fitz.open(path)
+    pages = [
+        (
+            page.get_text(),
+            sorted(annot.type[1] for annot in page.annots()),
+            [(link["kind"], link.get("page"), link.get("uri")) for link in page.get_links()],
+            page.get_label(),
+            page.get_pixmap(dpi=36).samples,
+        )
+        for page in doc
+    ]
+    pages.append(doc.embfile_names())
+    return pages
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"pages": [0, 1, 2, 5], "remove_images": True},
+    {"remove_images": True, "image_mode": "overlap"},
+    {"remove_images": True, "image_mode": "pixelate"},
+])
+def test_parallel_output_matches_serial(shared_pdf, tmp_path, options):
+    serial = redact_text(str(shared_pdf), str(tmp_path / "serial.pdf"), KEYWORDS, **options)
+    parallel = redact_text(str(shared_pdf), str(tmp_path / "parallel.pdf"), KEYWORDS,
+                           page_workers=2, min_parallel_pages=2, **options)
+
+    assert parallel["pages_modified"] == serial["pages_modified"]
+    assert _summary(tmp_path / "parallel.pdf") == _summary(tmp_path / "serial.pdf")
+
+
+def test_redaction_removes_author_redact_annotations_and_links_over_matches(shared_pdf, tmp_path):
+    redact_text(str(shared_pdf), str(tmp_path / "out.pdf"), KEYWORDS, page_workers=2, min_parallel_pages=2)
+
+    doc = fitz.open(tmp_path / "out.pdf")
+    for page in doc:
+        assert "Smith" not in page.get_text()
+        assert [annot.type[1] for annot in page.annots()] == ["Text"]
+        assert all(link["kind"] == fitz.LINK_GOTO for link in page.get_links())
+
+
+def test_redact_bytes_matches_redact_text(shared_pdf, tmp_path):
+    options = {"pages": [0, 2, 3], "remove_images": True, "image_mode": "overlap", "verify": True}
+    report = redact_text(str(shared_pdf), str(tmp_path / "file.pdf"), KEYWORDS, **options)
+    output, bytes_report = redact_bytes(shared_pdf.read_bytes(), KEYWORDS, **options)
+    (tmp_path / "bytes.pdf").write_bytes(output)
+
+    assert set(bytes_report) == set(report) - {"output_path"}
+    for key in ("pages_modified", "pages_processed", "matches", "verification"):
+        assert bytes_report[key] == report[key]
+    assert _summary(tmp_path / "bytes.pdf") == _summary(tmp_path / "file.pdf")
+
+
+def test_verification_catches_phrases_the_redaction_missed(tmp_path):
+    # "John" and "Smith" are in separate text blocks, so the redaction's
+    # per-block search can't find the phrase
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 100), "Contact: John")
+    page.insert_text((72, 300), "Smith about the report")
+    doc.new_page().insert_text((72, 100), "Nothing to see")
+    doc.save(tmp_path / "split.pdf")
+
+    report = redact_text(str(tmp_path / "split.pdf"), str(tmp_path / "out.pdf"), ["John Smith"], verify=True)
+
+    assert report["pages_modified"] == []
+    assert not report["verification"]["passed"]
+    assert report["verification"]["pages"] == [
+        {"page": 0, "passed": False, "matches": 1},
+        {"page": 1, "passed": True, "matches": 0},
+    ]
+
+
+def test_image_mode_all_removes_shared_images_beyond_the_selected_pages(shared_pdf, tmp_path):
+    redact_text(str(shared_pdf), str(tmp_path / "out.pdf"), KEYWORDS, pages=[0], remove_images=True)
+
+    # Away from the redacted word, where only the image could paint
+    corner = fitz.Rect(380, 130, 390, 140)
+    assert fitz.open(shared_pdf)[7].get_pixmap(clip=corner).pixel(0, 0) == (0, 120, 200)
+    doc = fitz.open(tmp_path / "out.pdf")
+    assert [page.get_pixmap(clip=corner).pixel(0, 0) for page in doc] == [(255, 255, 255)] * 8
+
+
+def test_pixelate_keeps_images_that_are_already_small(tmp_path):
+    doc = fitz.open()
+    page = doc.new_page()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 16, 16), False)
+    pix.set_rect(pix.irect, (0, 120, 200))
+    page.insert_image(fitz.Rect(300, 50, 400, 150), pixmap=pix)
+    page.insert_text((310, 100), "secret")
+    doc.save(tmp_path / "small.pdf")
+
+    redact_text(str(tmp_path / "small.pdf"), str(tmp_path / "out.pdf"), ["secret"],
+                remove_images=True, image_mode="pixelate")
+
+    out = fitz.open(tmp_path / "out.pdf")[0]
+    assert len(out.get_images()) == 1
+    # The image still shows next to the redacted word
+    assert out.get_pixmap(clip=fitz.Rect(380, 130, 390, 140)).pixel(0, 0) == (0, 120, 200)
@@ -0,0 +1,118 @@
+import os
+import time
+
+import pytest
+
+from app.hashing import sha256_file
+from app.storage import LocalBackend, MemoryBackend, ObjectStore, is_object_key, link, prune_links
+
+
+def _put(store: ObjectStore, data: bytes, meta: dict = None) -> str:
+    path = store.staging_path(".pdf")
+    with open(path, "wb") as f:
+        f.write(data)
+    return store.put(path, meta)
+
+
+@pytest.fixture(params=["memory", "local"])
+def backend(request, tmp_path):
+    return MemoryBackend() if request.param == "memory" else LocalBackend(str(tmp_path / "objects"))
+
+
+def test_put_keys_objects_by_content_and_stores_them_once(backend):
+    store = ObjectStore(backend)
+
+    first = _put(store, b"same content", {"filename": "a.pdf"})
+    second = _put(store, b"same content", {"filename": "b.pdf"})
+
+    assert first == second and is_object_key(first)
+    assert sha256_file(store.path(first)) == first
+    assert store.meta(first)["filename"] == "a.pdf"
+    assert store.meta(first)["size"] == len(b"same content")
+    assert len(list(backend.entries())) == 1
+    # The staged copy of the duplicate was consumed
+    assert [n for n in os.listdir(backend.staging_dir()) if n.startswith(".new-")] == []
+
+
+def test_path_and_meta_of_unknown_keys(backend):
+    store = ObjectStore(backend)
+
+    assert store.path("0" * 64) is None
+    assert store.path("../etc/passwd") is None
+    assert store.meta("not-a-key") is None
+
+
+def test_gc_deletes_objects_unused_for_ttl(backend):
+    store = ObjectStore(backend, ttl=60)
+    key = _put(store, b"old")
+
+    assert store.gc(now=time.time() + 30) == 0
+    assert store.path(key) is not None
+    assert store.gc(now=time.time() + 120) == 1
+    assert store.path(key) is None
+    assert store.collected == 1
+
+
+def test_gc_reports_deleted_objects(backend):
+    deleted = []
+    store = ObjectStore(backend, ttl=60, on_delete=deleted.append)
+    key = _put(store, b"old")
+
+    store.gc(now=time.time() + 30)
+    assert deleted == []
+    store.gc(now=time.time() + 120)
+    assert deleted == [key]
+
+
+def test_gc_evicts_least_recently_used_over_quota(backend):
+    store = ObjectStore(backend, max_bytes=250)
+    keys = []
+    for n in range(3):
+        keys.append(_put(store, bytes([n]) * 100))
+        time.sleep(0.02)
+    # Using the oldest object makes the second one the least recently used
+    store.path(keys[0])
+
+    assert store.gc() == 1
+    assert store.path(keys[1]) is None
+    assert store.path(keys[0]) is not None and store.path(keys[2]) is not None
+
+
+def test_gc_removes_abandoned_staging_files(backend):
+    store = ObjectStore(backend)
+    fresh = store.staging_path()
+    stale = store.staging_path()
+    day_ago = time.time() - 2 * 24 * 3600
+    os.utime(stale, (day_ago, day_ago))
+
+    store.gc()
+
+    assert os.path.exists(fresh)
+    assert not os.path.exists(stale)
+
+
+def test_prune_links_removes_only_dangling_names(tmp_path):
+    store = ObjectStore(LocalBackend(str(tmp_path / "objects")), ttl=60)
+    names = tmp_path / "uploads"
+    names.mkdir()
+    kept = _put(store, b"kept")
+    gone = _put(store, b"gone")
+    link(names / "kept.pdf", store.path(kept))
+    link(names / "gone.pdf", store.path(gone))
+    (names / "plain.txt").write_text("not a link")
+    store.backend.delete(gone)
+
+    assert prune_links(names) == 1
+    assert sorted(os.listdir(names)) == ["kept.pdf", "plain.txt"]
+
+
+def test_link_repoints_a_name_atomically(tmp_path):
+    store = ObjectStore(LocalBackend(str(tmp_path / "objects")))
+    first, second = _put(store, b"first"), _put(store, b"second")
+    alias = tmp_path / "doc.pdf"
+
+    link(alias, store.path(first))
+    link(alias, store.path(second))
+
+    assert alias.read_bytes() == b"second"
+    assert [n for n in os.listdir(tmp_path) if n.startswith(".link-")] == []
@@ -1,15 +1,32 @@
 import streamlit as st
 import requests
 from PIL import Image
-import fitz  # PyMuPDF
 import os
 from streamlit_drawable_canvas import st_canvas
 import zipfile
-import tempfile
+import io
 from pathlib import Path
 import json
 
+API_URL = os.environ.get("REDACTION_API_URL", "http://localhost:8000")
+
 st.set_page_config(page_title="PDF Redaction PoC", layout="wide")
+
+
+# Cached per content hash, so a replaced upload is fetched again
+@st.cache_data(show_spinner=False)
+def fetch_document_info(filename, digest):
+    response = requests.get(f"{API_URL}/preview/{filename}")
+    response.raise_for_status()
+    return response.json()
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def fetch_preview(filename, digest, page, width):
+    response = requests.get(f"{API_URL}/preview/{filename}/{page}", params={"w": width})
+    response.raise_for_status()
+    return Image.open(io.BytesIO(response.content)).convert("RGB")
+
 st.title("🔒 PDF Redaction Proof of Concept")
 
 # Initialize session state
@@ -43,17 +60,19 @@ if uploaded_files:
     for idx, uploaded_file in enumerate(uploaded_files):
         if uploaded_file.name not in st.session_state.uploaded_files:
             filename = uploaded_file.name
-            upload_path = f"uploads/{filename}"
-            
-            # Create uploads directory if it doesn't exist
-            os.makedirs("uploads", exist_ok=True)
-            
-            with open(upload_path, "wb") as f:
-                f.write(uploaded_file.read())
-            
+
+            # Upload through the API, which stores the file by content hash
+            response = requests.post(
+                f"{API_URL}/upload",
+                files={"file": (filename, uploaded_file.getvalue(), "application/pdf")},
+            )
+            if response.status_code != 200:
+                st.error(f"Failed to upload {filename}: {response.text}")
+                continue
+
             # Store file info
             st.session_state.uploaded_files[filename] = {
-                "path": upload_path,
+                "sha256": response.json()["sha256"],
                 "index": len(st.session_state.uploaded_files)
             }
     
@@ -87,22 +106,17 @@ if uploaded_files:
     
     # Get current file
     current_file = list(st.session_state.uploaded_files.keys())[st.session_state.current_file_index]
-    current_file_path = st.session_state.uploaded_files[current_file]["path"]
+    current_digest = st.session_state.uploaded_files[current_file]["sha256"]
     
-    # Load current PDF
-    doc = fitz.open(current_file_path)
-    num_pages = len(doc)
+    # Page count and sizes come from the backend, which also renders the pages
+    info = fetch_document_info(current_file, current_digest)
+    num_pages = info["page_count"]
 
     # Reset page if it's out of bounds for the current file
     if st.session_state.selected_page >= num_pages:
         st.session_state.selected_page = 0
 
     selected_page = st.session_state.selected_page
-    page = doc[selected_page]
-
-    # Render selected page as image
-    pix = page.get_pixmap(dpi=72)
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
 
     # Page navigation
     st.subheader("📄 Page Navigation")
@@ -120,14 +134,15 @@ if uploaded_files:
     with page_nav_col2:
         st.markdown(f"<div style='text-align:center;'>**Page {selected_page + 1} of {num_pages}**</div>", unsafe_allow_html=True)
 
-    # Calculate display dimensions
+    # Calculate display dimensions from the page size in points
     max_width = 800
-    scale_factor = min(max_width / img.width, max_width / img.height)
-    display_width = int(img.width * scale_factor)
-    display_height = int(img.height * scale_factor)
-    
-    # Resize image for consistent display
-    display_img = img.resize((display_width, display_height), Image.Resampling.LANCZOS)
+    page_width, page_height = info["page_sizes"][selected_page]
+    scale_factor = min(max_width / page_width, max_width / page_height)
+    display_width = int(page_width * scale_factor)
+    display_height = int(page_height * scale_factor)
+
+    # The backend renders the page at exactly the display width
+    display_img = fetch_preview(current_file, info["sha256"], selected_page, display_width)
 
     # Side by side layout
     col1, col2 = st.columns(2)
@@ -211,8 +226,6 @@ if uploaded_files:
             st.error(f"Error rendering canvas on Page {selected_page + 1}: {e}")
             canvas_result = None
 
-    doc.close()
-
     # Show current page boxes count
     file_page_key = f"{current_file}_{selected_page}"
     current_boxes = st.session_state.manual_boxes.get(file_page_key, [])
@@ -268,7 +281,7 @@ if uploaded_files:
             }
 
             with st.spinner(f"Redacting {current_file}..."):
-                response = requests.post("http://localhost:8000/redact/manual", json=data)
+                response = requests.post(f"{API_URL}/redact/manual", json=data)
 
             if response.status_code == 200:
                 st.success("✅ Redaction complete")
@@ -279,52 +292,42 @@ if uploaded_files:
                 st.error("❌ Redaction failed. Please check backend logs.")
         
         else:
-            redacted_files = []
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            for idx, filename in enumerate(st.session_state.uploaded_files.keys()):
-                status_text.text(f"Processing {filename}...")
-                
+            filenames = list(st.session_state.uploaded_files.keys())
+
+            # Group manual boxes per file for the batch request
+            boxes_by_file = {}
+            for filename in filenames:
                 file_boxes = []
                 for key, boxes in st.session_state.manual_boxes.items():
                     if key.startswith(filename + "_"):
                         file_boxes.extend(boxes)
-                
-                data = {
-                    "filename": filename,
-                    "keywords": keywords,
-                    "page_range": page_range,
-                    "remove_graphics": remove_graphics,
-                    "manual_boxes": file_boxes
-                }
+                if file_boxes:
+                    boxes_by_file[filename] = file_boxes
 
-                response = requests.post("http://localhost:8000/redact/manual", json=data)
-                
-                if response.status_code == 200:
-                    output_file = response.json()["redacted_file"]
-                    redacted_files.append(output_file)
-                else:
-                    st.error(f"❌ Failed to redact {filename}")
-                
-                progress_bar.progress((idx + 1) / len(st.session_state.uploaded_files))
-            
-            status_text.text("Processing complete!")
-            
-            if redacted_files:
-                if len(redacted_files) == 1:
-                    with open(redacted_files[0], "rb") as f:
-                        st.download_button("⬇️ Download Redacted PDF", f, file_name=f"{redacted_files[0].split('/')[-1]}")
-                else:
-                    with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp_zip:
-                        with zipfile.ZipFile(tmp_zip.name, 'w') as zipf:
-                            for file_path in redacted_files:
-                                zipf.write(file_path, os.path.basename(file_path))
-                        
-                        with open(tmp_zip.name, "rb") as f:
-                            st.download_button("⬇️ Download All Redacted PDFs (ZIP)", f, file_name="redacted_pdfs.zip", mime="application/zip")
-                
-                st.success(f"✅ Successfully processed {len(redacted_files)} files")
+            data = {
+                "filenames": filenames,
+                "keywords": keywords,
+                "page_range": page_range,
+                "remove_graphics": remove_graphics,
+                "manual_boxes": boxes_by_file
+            }
+
+            # The backend redacts all files concurrently and returns one ZIP
+            with st.spinner(f"Redacting {len(filenames)} files..."):
+                response = requests.post(f"{API_URL}/redact/batch", json=data)
+
+            if response.status_code == 200:
+                with zipfile.ZipFile(io.BytesIO(response.content)) as zipf:
+                    names = zipf.namelist()
+                    if "errors.json" in names:
+                        for failed, error in json.loads(zipf.read("errors.json")).items():
+                            st.error(f"❌ Failed to redact {failed}: {error}")
+                        names.remove("errors.json")
+
+                st.download_button("⬇️ Download All Redacted PDFs (ZIP)", response.content, file_name="redacted_pdfs.zip", mime="application/zip")
+                st.success(f"✅ Successfully processed {len(names)} files")
+            else:
+                st.error("❌ Batch redaction failed. Please check backend logs.")
 
     # Clear all data button
     if st.button("🗑️ Clear All Data"):